@@ -0,0 +1,256 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from bson import json_util
+
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "300"))
+# Au-delà de ce nombre de produits, un résultat n'est pas mis en cache
+QUERY_CACHE_MAX_ITEMS = int(os.environ.get("QUERY_CACHE_MAX_ITEMS", "1000"))
+# Backend partagé entre workers (ex. redis://localhost:6379/0) ; vide = cache local seul
+QUERY_CACHE_REDIS_URL = os.environ.get("QUERY_CACHE_REDIS_URL", "")
+FACETS_CACHE_TTL = float(os.environ.get("FACETS_CACHE_TTL", "30"))
+# Durée pendant laquelle la version partagée lue dans Redis est réutilisée :
+# borne le délai de propagation d'une écriture faite par un autre processus
+QUERY_CACHE_VERSION_TTL = float(os.environ.get("QUERY_CACHE_VERSION_TTL", "1"))
+
+# Version du catalogue : incrémentée à chaque écriture des scrapers, elle
+# invalide d'un coup toutes les entrées de cache calculées avant l'écriture.
+_catalog_version = 0
+_shared_backend = None
+
+
+class RedisBackend:
+    """Cache partagé entre processus ; la version du catalogue y est aussi stockée."""
+
+    version_key = "arbook:catalog_version"
+    prefix = "arbook:query:"
+
+    def __init__(self, url: str, version_ttl: float = QUERY_CACHE_VERSION_TTL):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ImportError("QUERY_CACHE_REDIS_URL nécessite le paquet `redis`.") from e
+        self.client = redis.from_url(url)
+        self.version_ttl = version_ttl
+        self._version = None
+        self._version_expires_at = 0.0
+
+    def _remember_version(self, version: int) -> int:
+        self._version = version
+        self._version_expires_at = time.monotonic() + self.version_ttl
+        return version
+
+    async def version(self) -> int:
+        """Version partagée, relue au plus une fois par `version_ttl` secondes."""
+        if self._version is not None and self._version_expires_at > time.monotonic():
+            return self._version
+        return self._remember_version(int(await self.client.get(self.version_key) or 0))
+
+    async def bump(self) -> int:
+        # La nouvelle version est visible aussitôt par les lectures de ce processus
+        return self._remember_version(await self.client.incr(self.version_key))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, ex=max(int(ttl), 1))
+
+
+def get_shared_backend() -> Optional[RedisBackend]:
+    global _shared_backend
+    if _shared_backend is None and QUERY_CACHE_REDIS_URL:
+        try:
+            _shared_backend = RedisBackend(QUERY_CACHE_REDIS_URL)
+        except ImportError as e:
+            logging.warning(f"Cache partagé désactivé : {e}")
+            return None
+    return _shared_backend
+
+
+def catalog_version() -> int:
+    return _catalog_version
+
+
+async def bump_catalog_version() -> int:
+    """À attendre après toute écriture dans Product_scraping.
+
+    La version locale et, si un backend partagé est configuré, la version
+    partagée sont incrémentées avant le retour : une lecture qui suit
+    l'écriture ne peut plus reprendre un résultat calculé avant elle.
+    """
+    global _catalog_version
+    _catalog_version += 1
+    backend = get_shared_backend()
+    if backend is not None:
+        try:
+            await backend.bump()
+        except Exception as e:
+            logging.warning(f"Incrément de la version partagée impossible : {e}")
+    return _catalog_version
+
+
+class QueryCache:
+    """Cache de lecture des méthodes de `Query` : LRU local, puis backend partagé.
+
+    Les clés combinent la méthode, ses arguments normalisés et la version du
+    catalogue : une écriture rend toutes les entrées antérieures inaccessibles.
+    Les requêtes concurrentes sur une même clé absente sont regroupées
+    (singleflight) : une seule interroge MongoDB, les autres attendent son résultat.
+    Les résultats vides ne sont pas mis en cache, `Query` renvoyant aussi une
+    liste vide en cas d'erreur.
+    """
+
+    def __init__(
+        self,
+        max_size: int = QUERY_CACHE_SIZE,
+        ttl: float = QUERY_CACHE_TTL,
+        max_items: int = QUERY_CACHE_MAX_ITEMS,
+        backend: Optional[RedisBackend] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_items = max_items
+        self.backend = backend
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self._seen_versions = None
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0, "coalesced": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["QueryCache"]:
+        if QUERY_CACHE_SIZE <= 0:
+            return None
+        return cls(backend=get_shared_backend())
+
+    @staticmethod
+    def make_key(method: str, params: dict) -> str:
+        payload = json.dumps(params, sort_keys=True, default=str)
+        return f"{method}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+    def _cacheable(self, value) -> bool:
+        if isinstance(value, dict) and "items" in value:
+            value = value["items"]  # Page de résultats paginée
+        if not value:
+            return False
+        return not isinstance(value, list) or len(value) <= self.max_items
+
+    async def _shared_version(self) -> int:
+        if self.backend is None:
+            return 0
+        try:
+            return await self.backend.version()
+        except Exception as e:
+            logging.warning(f"Cache partagé indisponible : {e}")
+            return -1
+
+    async def _load(self, key: str, shared_version: int, loader, ttl: float):
+        shared_key = f"{shared_version}:{key}"
+        if self.backend is not None and shared_version >= 0:
+            try:
+                payload = await self.backend.get(shared_key)
+                if payload is not None:
+                    self.stats["shared_hits"] += 1
+                    return json_util.loads(payload)
+            except Exception as e:
+                logging.warning(f"Lecture du cache partagé impossible : {e}")
+
+        self.stats["misses"] += 1
+        value = await loader()
+        if self.backend is not None and shared_version >= 0 and self._cacheable(value):
+            try:
+                await self.backend.set(shared_key, json_util.dumps(value), ttl)
+            except Exception as e:
+                logging.warning(f"Écriture du cache partagé impossible : {e}")
+        return value
+
+    async def get_or_load(
+        self,
+        method: str,
+        params: dict,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+    ):
+        ttl = self.ttl if ttl is None else ttl
+        key = self.make_key(method, params)
+        local_key = (key, catalog_version(), await self._shared_version())
+        if local_key[1:] != self._seen_versions:
+            # Nouvelle version du catalogue : les entrées locales sont périmées
+            self._entries.clear()
+            self._seen_versions = local_key[1:]
+
+        entry = self._entries.get(local_key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(local_key)
+                self.stats["hits"] += 1
+                return value
+            del self._entries[local_key]
+
+        task = self._inflight.get(local_key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._load(key, local_key[2], loader, ttl))
+        self._inflight[local_key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(local_key, None))
+        value = await asyncio.shield(task)
+
+        if self._cacheable(value):
+            self._entries[local_key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(local_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        hits = self.stats["hits"] + self.stats["shared_hits"] + self.stats["coalesced"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "catalog_version": catalog_version(),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+
+def cached(ttl: Optional[float] = None):
+    """Décore une méthode de `Query` pour la servir depuis `self.cache` (si présent).
+
+    Les arguments, valeurs par défaut comprises, forment la clé de cache. Les
+    résultats mis en cache sont partagés : les appelants ne doivent pas les modifier.
+    """
+
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            if self.cache is None:
+                return await method(self, *args, **kwargs)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = dict(list(bound.arguments.items())[1:])
+            return await self.cache.get_or_load(
+                method.__name__, params, lambda: method(self, *args, **kwargs), ttl
+            )
+
+        return wrapper
+
+    return decorator
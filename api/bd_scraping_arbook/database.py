@@ -4,10 +4,31 @@ from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from api.bd_scraping_arbook.models_scraping import Product_scraping
+from api.bd_scraping_arbook.monitoring import pool_metrics, command_metrics
 logging.basicConfig(level=os.environ.get("LOGLEVEL"))
 
 MONGO_URI = os.environ.get('MONGODB_URI')
 
+
+def _optional_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+# Options du client Motor ; elles priment sur celles de l'URI MONGODB_URI
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+    "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")),
+    "maxIdleTimeMS": _optional_int("MONGO_MAX_IDLE_TIME_MS"),
+    # Temps d'attente maximal d'une connexion libre quand le pool est saturé
+    "waitQueueTimeoutMS": _optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+    "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "socketTimeoutMS": _optional_int("MONGO_SOCKET_TIMEOUT_MS"),
+    # snappy nécessite `python-snappy` ; un compresseur indisponible est ignoré
+    "compressors": os.environ.get("MONGO_COMPRESSORS", "zstd,zlib"),
+}
+
 class DatabaseManager:
     _instance = None
     _initialized = False  # ✅ Flag global pour éviter plusieurs initialisations
@@ -34,7 +55,12 @@ class DatabaseManager:
             return True
 
         try:
-            self._client = AsyncIOMotorClient(self.connection_string)
+            options = {k: v for k, v in MONGO_CLIENT_OPTIONS.items() if v is not None}
+            self._client = AsyncIOMotorClient(
+                self.connection_string,
+                event_listeners=[pool_metrics, command_metrics],
+                **options,
+            )
             database = self._client[self.database_name]
 
             # ✅ Initialiser Beanie une seule fois
@@ -56,6 +82,15 @@ class DatabaseManager:
             return None
         return self._client
 
+    def get_metrics(self) -> dict:
+        """Options du pool et métriques collectées par les listeners PyMongo."""
+        return {
+            "initialized": DatabaseManager._initialized,
+            "options": {k: v for k, v in MONGO_CLIENT_OPTIONS.items() if v is not None},
+            "pool": pool_metrics.get_stats(),
+            "commands": command_metrics.get_stats(),
+        }
+
     def is_initialized(self) -> bool:
         """Retourne True si la base est initialisée, sinon False."""
         return DatabaseManager._initialized
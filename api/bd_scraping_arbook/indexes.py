@@ -0,0 +1,121 @@
+import re
+from typing import Dict, List
+
+from pymongo import ASCENDING, IndexModel
+
+# Nom réel de la collection, partagé par Beanie (Settings.name) et les requêtes brutes
+PRODUCT_COLLECTION = "Product_scraping"
+
+# Requête représentative et index attendu pour chaque méthode de `Query`.
+# `collscan_expected` signale les parcours complets assumés (recherche floue,
+# regex non ancrée) : l'audit les rapporte sans les considérer comme une erreur.
+QUERY_PLANS: Dict[str, dict] = {
+    "get_all_product": {
+        "filter": {"source": "vinted"},
+        "index": [("source", ASCENDING)],
+    },
+    "get_products_by_category": {
+        "filter": {"categories": "Femmes"},
+        "index": [("categories", ASCENDING)],
+    },
+    "search_products_by_name": {
+        "filter": {"name": {"$regex": re.compile("robe", re.IGNORECASE)}},
+        "index": [("name", ASCENDING)],
+    },
+    "search_products_by_price_range": {
+        "filter": {"price_cents": {"$gte": 1000, "$lte": 5000}},
+        "index": [("price_cents", ASCENDING)],
+    },
+    "search_products_by_brand": {
+        "filter": {"brand": "Nike"},
+        "index": [("brand", ASCENDING)],
+    },
+    "search_products_by_condition": {
+        "filter": {"condition": "Très bon état"},
+        "index": [("condition", ASCENDING)],
+    },
+    "search_products_by_description_keywords": {
+        "filter": {"description": {"$regex": re.compile("coton", re.IGNORECASE)}},
+        "index": None,
+        "collscan_expected": True,
+    },
+    "get_products_with_pagination": {
+        "filter": {},
+        "sort": [("_id", ASCENDING)],
+        "index": None,  # Index _id implicite
+    },
+    "search_products_by_multiple_categories": {
+        "filter": {"categories": {"$all": ["Femmes", "Robes"]}},
+        "index": [("categories", ASCENDING)],
+    },
+    "search_products": {
+        "filter": {"source": "vinted", "price_cents": {"$type": "number", "$lte": 5000}},
+        "sort": [("price_cents", ASCENDING), ("_id", ASCENDING)],
+        "index": [("source", ASCENDING), ("price_cents", ASCENDING)],
+    },
+    "search_categories": {
+        "filter": {},
+        "index": None,
+        "collscan_expected": True,
+    },
+}
+
+# Index hors `Query` : unicité, synchronisation ChromaDB et plages de prix combinées
+BASE_INDEXES: List[IndexModel] = [
+    IndexModel([("product_id", ASCENDING), ("source", ASCENDING)], unique=True),
+    # Filigrane de la synchronisation incrémentale MongoDB -> ChromaDB
+    IndexModel([("updated_at", ASCENDING)]),
+    IndexModel([("source", ASCENDING), ("price_cents", ASCENDING)]),
+    IndexModel([("categories", ASCENDING), ("price_cents", ASCENDING)]),
+    IndexModel([("condition_normalized", ASCENDING), ("price_cents", ASCENDING)]),
+    IndexModel([("brand", ASCENDING), ("price_cents", ASCENDING)]),
+]
+
+
+def product_indexes() -> List[IndexModel]:
+    """Tous les index de la collection, sans doublon de clés."""
+    indexes, seen = [], set()
+    query_indexes = [IndexModel(plan["index"]) for plan in QUERY_PLANS.values() if plan["index"]]
+    for index in BASE_INDEXES + query_indexes:
+        keys = tuple(index.document["key"].items())
+        if keys not in seen:
+            seen.add(keys)
+            indexes.append(index)
+    return indexes
+
+
+PRODUCT_INDEXES = product_indexes()
+
+
+async def ensure_indexes(collection) -> List[str]:
+    """Crée les index manquants (les index existants identiques sont ignorés par MongoDB)."""
+    return await collection.create_indexes(PRODUCT_INDEXES)
+
+
+def plan_stages(plan: dict) -> List[str]:
+    """Liste à plat des étapes d'un plan d'exécution `explain`."""
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+async def explain(database, collection_name: str, plan: dict) -> dict:
+    """Exécute `explain` (executionStats) pour la requête type d'une méthode de `Query`."""
+    command = {"find": collection_name, "filter": plan["filter"]}
+    if plan.get("sort"):
+        command["sort"] = dict(plan["sort"])
+    result = await database.command("explain", command, verbosity="executionStats")
+    stages = plan_stages(result["queryPlanner"]["winningPlan"])
+    stats = result.get("executionStats", {})
+    return {
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "time_ms": stats.get("executionTimeMillis"),
+    }
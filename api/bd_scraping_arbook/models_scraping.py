@@ -1,6 +1,7 @@
 from beanie import Document, Indexed
-from pymongo import IndexModel, ASCENDING
-from typing import Optional, List, Dict, Union
+from typing import Any, Optional, List, Dict, Union
+from datetime import datetime
+from .indexes import PRODUCT_COLLECTION, PRODUCT_INDEXES
 
 class Product_scraping(Document):
     source: Indexed(str)
@@ -29,12 +30,22 @@ class Product_scraping(Document):
     owner_profile_url: Optional[str] = None
     feature_table: Optional[Dict[str, str]] = None
     feature_bullet: Optional[List[str]] = None
+    updated_at: Optional[datetime] = None
+    # Champs normalisés à l'ingestion (voir api/scrapers/normalization.py)
+    price_cents: Optional[int] = None
+    currency: Optional[str] = None
+    delivery_price_cents: Optional[int] = None
+    price_with_protection_cents: Optional[int] = None
+    rating_value: Optional[float] = None
+    uploaded_at: Optional[datetime] = None
+    condition_normalized: Optional[str] = None
+    # Détection des changements (voir api/scrapers/change_detection.py)
+    last_seen_at: Optional[datetime] = None
+    content_hash: Optional[str] = None
+    price_history: Optional[List[Dict[str, Any]]] = None
 
     class Settings:
-        collection = "products_scraping"
-        indexes = [
-            IndexModel(
-                [("product_id", ASCENDING), ("source", ASCENDING)],
-                unique=True,
-            )
-        ]
\ No newline at end of file
+        # Beanie lit `name` : l'ancien attribut `collection` était ignoré
+        name = PRODUCT_COLLECTION
+        # Créés par init_beanie au démarrage (voir indexes.py)
+        indexes = PRODUCT_INDEXES
\ No newline at end of file
@@ -0,0 +1,133 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+from pymongo import monitoring
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Occupation du pool de connexions Motor : connexions ouvertes, empruntées, attentes."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = defaultdict(int)
+        self.pool_clears = 0
+        self._wait_ms = deque(maxlen=window)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            # Raison "timeout" : pool saturé pendant waitQueueTimeoutMS
+            self.checkout_failures[str(event.reason)] += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            duration = getattr(event, "duration", None)
+            if duration is not None:
+                self._wait_ms.append(duration * 1000)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            waits = list(self._wait_ms)
+            return {
+                "open_connections": self.created - self.closed,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "pool_clears": self.pool_clears,
+                "checkout_wait_p50_ms": _percentile(waits, 0.5),
+                "checkout_wait_p95_ms": _percentile(waits, 0.95),
+            }
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Nombre, échecs et latence (p50/p95/max) des commandes MongoDB, par nom de commande."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.window = window
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, int] = defaultdict(int)
+        self._latencies_ms: Dict[str, deque] = {}
+
+    def _record(self, event):
+        latencies = self._latencies_ms.get(event.command_name)
+        if latencies is None:
+            latencies = self._latencies_ms[event.command_name] = deque(maxlen=self.window)
+        latencies.append(event.duration_micros / 1000)
+        self.counts[event.command_name] += 1
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            self._record(event)
+
+    def failed(self, event):
+        with self._lock:
+            self._record(event)
+            self.failures[event.command_name] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "count": self.counts[name],
+                    "failures": self.failures.get(name, 0),
+                    "p50_ms": _percentile(latencies, 0.5),
+                    "p95_ms": _percentile(latencies, 0.95),
+                    "max_ms": max(latencies) if latencies else None,
+                }
+                for name, latencies in self._latencies_ms.items()
+            }
+
+
+pool_metrics = PoolMetrics()
+command_metrics = CommandMetrics()
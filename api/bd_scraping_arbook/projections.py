@@ -0,0 +1,53 @@
+from dataclasses import fields as dataclass_fields
+from typing import Iterable, Optional
+
+from api.scrapers.utils import Product
+from .models_scraping import Product_scraping
+
+# Champs de la vue liste (cartes produit) : quelques centaines d'octets par produit
+LIST_FIELDS = [
+    "source",
+    "product_id",
+    "name",
+    "price",
+    "price_cents",
+    "currency",
+    "url",
+    "main_photo",
+    "condition",
+    "brand",
+    "stock",
+]
+
+# Vue détail : champs exposés par l'API, sans les champs internes (updated_at...)
+DETAIL_FIELDS = [field.name for field in dataclass_fields(Product)]
+
+VIEWS = {"list": LIST_FIELDS, "detail": DETAIL_FIELDS}
+
+# Champs pouvant être demandés explicitement par l'appelant
+ALLOWED_FIELDS = (
+    set(Product_scraping.model_fields) - {"id", "revision_id"}
+) | {"_id"}
+
+
+def resolve_projection(
+    view: Optional[str] = None, fields: Optional[Iterable[str]] = None
+) -> Optional[dict]:
+    """Projection MongoDB pour une vue nommée et/ou une liste de champs.
+
+    Retourne None (document complet) si aucun des deux n'est fourni. `source`
+    est toujours inclus, car requis par le modèle de réponse `Product`.
+    """
+    if view is None and not fields:
+        return None
+    if view is not None and view not in VIEWS and view != "full":
+        raise ValueError(f"Vue inconnue : {view} (list, detail ou full)")
+    if view == "full":
+        return None
+
+    selected = list(VIEWS.get(view, []))
+    for field in fields or []:
+        if field not in ALLOWED_FIELDS:
+            raise ValueError(f"Champ inconnu : {field}")
+        selected.append(field)
+    return {"source": 1, **{field: 1 for field in selected}}
@@ -2,24 +2,111 @@ from fuzzywuzzy import fuzz
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import Document
 from typing import List, Optional
+import base64
 import logging
 import re
+from bson import ObjectId, json_util
 from pymongo import ASCENDING, DESCENDING
 import os
+from .indexes import PRODUCT_COLLECTION
+from .cache import FACETS_CACHE_TTL, QueryCache, cached
 
 logging.basicConfig(level=os.environ.get("LOGLEVEL"))
 
+# Bornes (en centimes) des tranches de prix des facettes
+PRICE_BUCKETS = [0, 1000, 2000, 5000, 10000, 20000, 50000]
+
+# Tris de la recherche combinée : champ, sens et type requis pour la pagination par clé
+SEARCH_SORTS = {
+    "price_asc": ("price_cents", ASCENDING, "number"),
+    "price_desc": ("price_cents", DESCENDING, "number"),
+    "newest": ("updated_at", DESCENDING, "date"),
+    "id": ("_id", ASCENDING, None),
+}
+
+
+def build_filter(
+    source: Optional[str] = None,
+    brand: Optional[str] = None,
+    condition: Optional[str] = None,
+    categories: Optional[List[str]] = None,
+    categories_mode: str = "all",
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    text: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+) -> dict:
+    """Compile une conjonction de critères en un filtre MongoDB.
+
+    Égalités sur des champs indexés (source, marque, état normalisé, catégories),
+    plage sur `price_cents` ; `text` est une recherche insensible à la casse sur le nom.
+    """
+    match = {}
+    if source:
+        match["source"] = source
+    if brand:
+        match["brand"] = brand
+    if condition:
+        match["condition_normalized"] = condition
+    if categories:
+        if len(categories) == 1:
+            match["categories"] = categories[0]
+        else:
+            match["categories"] = {"$all" if categories_mode == "all" else "$in": categories}
+    if min_price is not None or max_price is not None:
+        match["price_cents"] = {}
+        if min_price is not None:
+            match["price_cents"]["$gte"] = int(round(min_price * 100))
+        if max_price is not None:
+            match["price_cents"]["$lte"] = int(round(max_price * 100))
+    if text:
+        match["name"] = {"$regex": re.escape(text), "$options": "i"}
+    if in_stock is not None:
+        match["stock"] = in_stock
+    return match
+
+
+def encode_cursor(value, doc_id) -> str:
+    payload = json_util.dumps({"v": value, "id": ObjectId(doc_id)})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """Retourne (valeur du tri, _id) du dernier produit de la page précédente."""
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return payload["v"], payload["id"]
+    except Exception as e:
+        raise ValueError(f"Curseur invalide : {cursor}") from e
+
 
 class Query:
-    """Classe pour effectuer des recherches"""
+    """Classe pour effectuer des recherches
+
+    Le paramètre `projection` des méthodes est une projection MongoDB (voir
+    projections.py) ; None retourne les documents complets.
+    """
 
-    def __init__(self, db_manager):
-        """Initialise la classe Query avec un db_manager."""
+    def __init__(self, db_manager, cache: Optional[QueryCache] = None):
+        """Initialise la classe Query avec un db_manager.
+
+        Sans `cache` explicite, le cache de résultats est configuré par
+        l'environnement (QUERY_CACHE_SIZE=0 le désactive).
+        """
         self.db_manager = db_manager
         self.collection = None
+        self.cache = cache if cache is not None else QueryCache.from_env()
 
     async def __check_db(self):
         """Vérifie et initialise la base de données et la collection."""
+        # Chemin rapide : collection déjà liée au client courant
+        if (
+            self.collection is not None
+            and self.db_manager.is_initialized()
+            and self.collection.database.client is self.db_manager.get_client()
+        ):
+            return True
+        self.collection = None
         if not self.db_manager.is_initialized():
             success = await self.db_manager.initialize()
             if not success:
@@ -31,41 +118,47 @@ class Query:
                 logging.error("MongoDB client is not initialized.")
                 return False
             db = client[self.db_manager.database_name]
-            self.collection = db["Product_scraping"]
-            logging.info("Collection Product_scraping initialisée.")
+            self.collection = db[PRODUCT_COLLECTION]
+            logging.info(f"Collection {PRODUCT_COLLECTION} initialisée.")
         return True
 
-    async def search_categories(self, query, similarity_threshold=80) -> List[Document]:
-        """Effectue une recherche floue sur les catégories de produits."""
+    @cached()
+    async def search_categories(
+        self, query, similarity_threshold=80, projection: Optional[dict] = None
+    ) -> List[Document]:
+        """Effectue une recherche floue sur les catégories de produits.
+
+        Seules les catégories sont parcourues ; les produits retenus sont
+        ensuite lus avec la projection demandée.
+        """
         if not await self.__check_db():
             return []
         try:
-            results = await self.collection.find().to_list(length=None)
-            filtered_results = self._filter_results(
-                results, query, similarity_threshold
-            )
-            return filtered_results
+            matched_ids = []
+            async for result in self.collection.find({}, {"categories": 1}):
+                if self._match_categories(
+                    result.get("categories"), query, similarity_threshold
+                ):
+                    matched_ids.append(result["_id"])
+            if not matched_ids:
+                return []
+            results = await self.collection.find(
+                {"_id": {"$in": matched_ids}}, projection
+            ).to_list()
+            return self.__format_results(results)
         except Exception as e:
             logging.error(f"Erreur lors de la recherche dans la base de données: {e}")
             return []
 
-    def _filter_results(self, results, query, similarity_threshold):
-        """Filtre les résultats en utilisant fuzzywuzzy."""
-        filtered_results = []
-        for result in results:
-            categories = result.get("categories", [])
-            if categories is None:
+    @staticmethod
+    def _match_categories(categories, query, similarity_threshold):
+        """Vrai si une des catégories ressemble à `query` (fuzzywuzzy)."""
+        for category in categories or []:
+            if category is None:
                 continue
-            for category in categories:
-                if category is None:
-                    continue
-                if (
-                    fuzz.partial_ratio(query.lower(), category.lower())
-                    > similarity_threshold
-                ):
-                    result["_id"] = str(result["_id"])
-                    filtered_results.append(result)
-        return filtered_results
+            if fuzz.partial_ratio(query.lower(), category.lower()) > similarity_threshold:
+                return True
+        return False
 
     def __format_results(self, results):
         """Formate les résultats en convertissant _id en chaîne."""
@@ -78,13 +171,16 @@ class Query:
                 logging.error(f"Erreur lors du formatage des résultats: {e}")
         return formatted_results
 
-    async def get_all_product(self, source: Optional[str] = None) -> List[Document]:
+    @cached()
+    async def get_all_product(
+        self, source: Optional[str] = None, projection: Optional[dict] = None
+    ) -> List[Document]:
         """Récupère tous les produits, éventuellement filtrés par source."""
         if not await self.__check_db():
             return []
         try:
             query = {"source": source} if source else {}
-            results = await self.collection.find(query).to_list()
+            results = await self.collection.find(query, projection).to_list()
             if results:
                 return self.__format_results(results)
             return []
@@ -92,12 +188,17 @@ class Query:
             logging.error(f"Erreur lors de la récupération des produits: {e}")
             return []
 
-    async def get_products_by_category(self, category: str) -> List[Document]:
+    @cached()
+    async def get_products_by_category(
+        self, category: str, projection: Optional[dict] = None
+    ) -> List[Document]:
         """Récupère tous les produits appartenant à une catégorie spécifique."""
         if not await self.__check_db():
             return []
         try:
-            results = await self.collection.find({"categories": category}).to_list()
+            results = await self.collection.find(
+                {"categories": category}, projection
+            ).to_list()
             if results:
                 return self.__format_results(results)
             return []
@@ -107,14 +208,17 @@ class Query:
             )
             return []
 
-    async def search_products_by_name(self, name: str) -> List[Document]:
+    @cached()
+    async def search_products_by_name(
+        self, name: str, projection: Optional[dict] = None
+    ) -> List[Document]:
         """Recherche les produits par nom, en utilisant une recherche floue."""
         if not await self.__check_db():
             return []
         try:
             regex_pattern = re.compile(re.escape(name), re.IGNORECASE)
             results = await self.collection.find(
-                {"name": {"$regex": regex_pattern}}
+                {"name": {"$regex": regex_pattern}}, projection
             ).to_list()
             if results:
                 return self.__format_results(results)
@@ -123,15 +227,23 @@ class Query:
             logging.error(f"Erreur lors de la recherche des produits par nom: {e}")
             return []
 
+    @cached()
     async def search_products_by_price_range(
-        self, min_price: float, max_price: float
+        self, min_price: float, max_price: float, projection: Optional[dict] = None
     ) -> List[Document]:
-        """Recherche les produits dans une plage de prix donnée."""
+        """Recherche les produits dans une plage de prix donnée (en unités monétaires)."""
         if not await self.__check_db():
             return []
         try:
+            # `price` est une chaîne localisée : la plage porte sur `price_cents` (indexé)
             results = await self.collection.find(
-                {"price": {"$gte": min_price, "$lte": max_price}}
+                {
+                    "price_cents": {
+                        "$gte": int(round(min_price * 100)),
+                        "$lte": int(round(max_price * 100)),
+                    }
+                },
+                projection,
             ).to_list()
             if results:
                 return self.__format_results(results)
@@ -142,12 +254,15 @@ class Query:
             )
             return []
 
-    async def search_products_by_brand(self, brand: str) -> List[Document]:
+    @cached()
+    async def search_products_by_brand(
+        self, brand: str, projection: Optional[dict] = None
+    ) -> List[Document]:
         """Recherche les produits par marque."""
         if not await self.__check_db():
             return []
         try:
-            results = await self.collection.find({"brand": brand}).to_list()
+            results = await self.collection.find({"brand": brand}, projection).to_list()
             if results:
                 return self.__format_results(results)
             return []
@@ -155,12 +270,17 @@ class Query:
             logging.error(f"Erreur lors de la recherche des produits par marque: {e}")
             return []
 
-    async def search_products_by_condition(self, condition: str) -> List[Document]:
+    @cached()
+    async def search_products_by_condition(
+        self, condition: str, projection: Optional[dict] = None
+    ) -> List[Document]:
         """Recherche les produits par état (condition)."""
         if not await self.__check_db():
             return []
         try:
-            results = await self.collection.find({"condition": condition}).to_list()
+            results = await self.collection.find(
+                {"condition": condition}, projection
+            ).to_list()
             if results:
                 return self.__format_results(results)
             return []
@@ -168,8 +288,9 @@ class Query:
             logging.error(f"Erreur lors de la recherche des produits par état: {e}")
             return []
 
+    @cached()
     async def search_products_by_description_keywords(
-        self, keywords: str
+        self, keywords: str, projection: Optional[dict] = None
     ) -> List[Document]:
         """Recherche les produits par mots-clés dans la description."""
         if not await self.__check_db():
@@ -177,7 +298,7 @@ class Query:
         try:
             regex_pattern = re.compile(re.escape(keywords), re.IGNORECASE)
             results = await self.collection.find(
-                {"description": {"$regex": regex_pattern}}
+                {"description": {"$regex": regex_pattern}}, projection
             ).to_list()
             if results:
                 return self.__format_results(results)
@@ -188,8 +309,9 @@ class Query:
             )
             return []
 
+    @cached()
     async def get_products_with_pagination(
-        self, page: int = 1, page_size: int = 10
+        self, page: int = 1, page_size: int = 10, projection: Optional[dict] = None
     ) -> List[Document]:
         """Récupère les produits avec pagination."""
         if not await self.__check_db():
@@ -197,10 +319,192 @@ class Query:
         try:
 
             skip = (page - 1) * page_size
-            results = await self.collection.find().skip(skip).limit(page_size).to_list()
+            # Tri explicite sur _id : pages stables et parcours de l'index _id
+            results = (
+                await self.collection.find({}, projection)
+                .sort("_id", ASCENDING)
+                .skip(skip)
+                .limit(page_size)
+                .to_list()
+            )
             if results:
                 return self.__format_results(results)
             return []
         except Exception as e:
             logging.error(f"Erreur lors de la récupération des produits avec pagination: {e}")
             return []
+
+    @cached()
+    async def search_products_by_multiple_categories(
+        self,
+        categories: List[str],
+        projection: Optional[dict] = None,
+        match_all: bool = True,
+    ) -> List[Document]:
+        """Recherche les produits appartenant à toutes (ou à l'une) des catégories."""
+        if not await self.__check_db():
+            return []
+        try:
+            operator = "$all" if match_all else "$in"
+            results = await self.collection.find(
+                {"categories": {operator: categories}}, projection
+            ).to_list()
+            if results:
+                return self.__format_results(results)
+            return []
+        except Exception as e:
+            logging.error(
+                f"Erreur lors de la recherche des produits par catégories: {e}"
+            )
+            return []
+
+    @cached()
+    async def search_products(
+        self,
+        filters: Optional[dict] = None,
+        sort: str = "id",
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        projection: Optional[dict] = None,
+    ) -> dict:
+        """Recherche multicritère (voir `build_filter`) triée et paginée par clé.
+
+        `cursor` est le `next_cursor` de la page précédente : la page suivante
+        reprend après le dernier (valeur de tri, _id) vu, sans `skip`.
+        Lève ValueError si le tri ou le curseur est invalide.
+        """
+        if sort not in SEARCH_SORTS:
+            raise ValueError(f"Tri inconnu : {sort} ({', '.join(SEARCH_SORTS)})")
+        field, direction, required_type = SEARCH_SORTS[sort]
+        match = build_filter(**(filters or {}))
+        clauses = [match] if match else []
+        if required_type:
+            # Les produits sans valeur de tri ne peuvent pas être paginés par clé
+            clauses.append({field: {"$type": required_type}})
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            operator = "$gt" if direction == ASCENDING else "$lt"
+            if field == "_id":
+                clauses.append({"_id": {operator: last_id}})
+            else:
+                clauses.append(
+                    {
+                        "$or": [
+                            {field: {operator: value}},
+                            {field: value, "_id": {operator: last_id}},
+                        ]
+                    }
+                )
+        query = {"$and": clauses} if len(clauses) > 1 else (clauses[0] if clauses else {})
+
+        if projection is not None and field != "_id":
+            projection = {**projection, field: 1}
+        if not await self.__check_db():
+            return {"items": [], "next_cursor": None}
+        try:
+            sort_spec = [(field, direction)]
+            if field != "_id":
+                sort_spec.append(("_id", direction))
+            results = (
+                await self.collection.find(query, projection)
+                .sort(sort_spec)
+                .limit(limit + 1)
+                .to_list()
+            )
+            next_cursor = None
+            if len(results) > limit:
+                results = results[:limit]
+                last = results[-1]
+                next_cursor = encode_cursor(
+                    last.get(field) if field != "_id" else None, last["_id"]
+                )
+            return {"items": self.__format_results(results), "next_cursor": next_cursor}
+        except Exception as e:
+            logging.error(f"Erreur lors de la recherche multicritère: {e}")
+            return {"items": [], "next_cursor": None}
+
+    @cached(ttl=FACETS_CACHE_TTL)
+    async def get_facets(
+        self,
+        source: Optional[str] = None,
+        brand: Optional[str] = None,
+        condition: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        top_categories: int = 20,
+    ) -> dict:
+        """Compte les produits par source, marque, état, catégorie et tranche de prix.
+
+        Une seule agrégation `$facet`, précédée d'un `$match` indexé ; le résultat
+        est mis en cache quelques secondes (FACETS_CACHE_TTL) et invalidé par les écritures.
+        """
+        if not await self.__check_db():
+            return {}
+        match = build_filter(
+            source,
+            brand,
+            condition,
+            [category] if category else None,
+            min_price=min_price,
+            max_price=max_price,
+        )
+
+        def count_by(field):
+            return [
+                {"$match": {field: {"$nin": [None, ""]}}},
+                {"$sortByCount": f"${field}"},
+            ]
+
+        pipeline = [
+            {"$match": match},
+            {
+                "$facet": {
+                    "total": [{"$count": "count"}],
+                    "source": count_by("source"),
+                    "brand": count_by("brand") + [{"$limit": 50}],
+                    "condition": count_by("condition_normalized"),
+                    "categories": [
+                        {"$project": {"categories": 1}},
+                        {"$unwind": "$categories"},
+                        *count_by("categories"),
+                        {"$limit": top_categories},
+                    ],
+                    "price": [
+                        {"$match": {"price_cents": {"$type": "number"}}},
+                        {
+                            "$bucket": {
+                                "groupBy": "$price_cents",
+                                "boundaries": PRICE_BUCKETS,
+                                "default": "other",
+                                "output": {"count": {"$sum": 1}},
+                            }
+                        },
+                    ],
+                }
+            },
+        ]
+        try:
+            result = (await self.collection.aggregate(pipeline).to_list(length=1))[0]
+        except Exception as e:
+            logging.error(f"Erreur lors du calcul des facettes: {e}")
+            return {}
+
+        facets = {
+            "total": result["total"][0]["count"] if result["total"] else 0,
+            **{
+                name: [{"value": b["_id"], "count": b["count"]} for b in result[name]]
+                for name in ("source", "brand", "condition", "categories")
+            },
+            "price": [self._price_bucket(b) for b in result["price"]],
+        }
+        return facets
+
+    @staticmethod
+    def _price_bucket(bucket):
+        """Tranche de prix en unités monétaires : {"min", "max", "count"}."""
+        lower = bucket["_id"]
+        if lower == "other":
+            return {"min": PRICE_BUCKETS[-1] / 100, "max": None, "count": bucket["count"]}
+        upper = PRICE_BUCKETS[PRICE_BUCKETS.index(lower) + 1]
+        return {"min": lower / 100, "max": upper / 100, "count": bucket["count"]}
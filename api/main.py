@@ -1,12 +1,38 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from api.route import router as api_router
-from database.db import engine, Base
+from database.db import engine, async_engine, Base
+from services_reconnaissance.face_recognition import inference_executor
+from chatbot.chat import Chatbot
+from api.scrapers.write_behind import product_writer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    chatbot = None
+    # File d'écriture différée des scrapers (rejoue aussi le fichier de secours)
+    await product_writer.start()
+    try:
+        chatbot = await Chatbot.create()
+        chatbot.start_background_refresh()
+    except Exception as e:
+        # Le chatbot sera initialisé à la première requête /bot/
+        logging.error(f"Erreur lors de l'initialisation du chatbot: {e}")
+    yield
+    if chatbot:
+        await chatbot.stop_background_refresh()
+    await product_writer.stop()
+    inference_executor.shutdown(wait=False)
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="API Arbooks",
     description="Une API detecter les image truque et scraper des site comme amazon et Vinted.",
     version="1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
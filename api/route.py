@@ -1,21 +1,30 @@
 from fastapi import FastAPI, APIRouter, UploadFile, Form, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from fastapi import Query as FastAPIQuery
 import os
+import json
 import shutil
 import logging
 
 # Import custom modules
 from fonction import exif_tools, image_tools, model_tools, ollama_tools
 from .bd_scraping_arbook.database import DatabaseManager
+from .bd_scraping_arbook.indexes import PRODUCT_COLLECTION
 from .scrapers.vinted_scraper import VintedScraper
 from .scrapers.amazon_scraper import AmazonScraper
-from services_reconnaissance.face_recognition import capture_face, recognize_face
-from database.db import get_db
+from .scrapers.write_behind import product_writer
+from services_reconnaissance.face_recognition import (
+    capture_face,
+    recognize_face,
+    recognize_faces,
+)
+from database.db import get_async_db
 from .bd_scraping_arbook.query import Query
+from .bd_scraping_arbook.projections import resolve_projection
 from .scrapers.utils import Product
 
 
@@ -106,11 +115,21 @@ class RecognizeRequest(BaseModel):
     image: str
 
 
+class RecognizeBatchRequest(BaseModel):
+    images: List[str]
+
+
+# Nombre max d'images acceptées par requête de reconnaissance groupée
+MAX_RECOGNIZE_IMAGES = int(os.environ.get("MAX_RECOGNIZE_IMAGES", "16"))
+
+
 @router.post("/capture_face/", tags=["Image"])
-async def capture_face_route(request: CaptureRequest, db: Session = Depends(get_db)):
+async def capture_face_route(
+    request: CaptureRequest, db: AsyncSession = Depends(get_async_db)
+):
     """Capture and save a face."""
     try:
-        message = capture_face(request.name, request.image, db)
+        message = await capture_face(request.name, request.image, db)
         return {"message": message}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -118,16 +137,32 @@ async def capture_face_route(request: CaptureRequest, db: Session = Depends(get_
 
 @router.post("/recognize_face/", tags=["Image"])
 async def recognize_face_route(
-    request: RecognizeRequest, db: Session = Depends(get_db)
+    request: RecognizeRequest, db: AsyncSession = Depends(get_async_db)
 ):
     """Recognize a face."""
     try:
-        match = recognize_face(request.image, db)
+        match = await recognize_face(request.image, db)
         return {"match": match}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/recognize_faces/", tags=["Image"])
+async def recognize_faces_route(
+    request: RecognizeBatchRequest, db: AsyncSession = Depends(get_async_db)
+):
+    """Recognize every face in several images."""
+    if not request.images:
+        raise HTTPException(status_code=400, detail="Aucune image fournie.")
+    if len(request.images) > MAX_RECOGNIZE_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {MAX_RECOGNIZE_IMAGES} images par requête.",
+        )
+    results = await recognize_faces(request.images, db)
+    return {"results": results}
+
+
 # Scraping endpoints
 db_manager = DatabaseManager()
 vinted_scraper = VintedScraper(db_manager)
@@ -228,7 +263,7 @@ async def fill_detail():
             return {"erreur": "Erreur de la db"}
     try:
 
-        collection = db_manager.get_client()["scraping_arbook"]["Product_scraping"]
+        collection = db_manager.get_client()[db_manager.database_name][PRODUCT_COLLECTION]
 
         documents = await collection.find({}).to_list(None)
 
@@ -304,25 +339,81 @@ async def search_all_platforms(query: str, limit: int = 10):
 
 
 # Requêtes de base de données
+def get_projection(
+    view: Optional[str] = FastAPIQuery(
+        None, description="Profil de champs : list, detail ou full"
+    ),
+    fields: Optional[str] = FastAPIQuery(
+        None, description="Champs supplémentaires, séparés par des virgules"
+    ),
+) -> Optional[dict]:
+    """Dépendance commune aux endpoints /products* : projection demandée par l'appelant."""
+    try:
+        return resolve_projection(
+            view, [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def projected_response(results, projection):
+    """Sans projection, le modèle de réponse s'applique ; sinon seuls les champs demandés sont renvoyés."""
+    if projection is None:
+        return results
+    return JSONResponse(content=jsonable_encoder(results))
+
+
 @router.get("/products", tags=["Query"], response_model=List[Product])
-async def get_all_products_endpoint(source: Optional[str] = None):
+async def get_all_products_endpoint(
+    source: Optional[str] = None, projection: Optional[dict] = Depends(get_projection)
+):
     """Récupère tous les produits, éventuellement filtrés par source."""
     try:
-        results = await query_instance.get_all_product(source)
-        return results
+        results = await query_instance.get_all_product(source, projection)
+        return projected_response(results, projection)
     except Exception as e:
         logging.error(f"Erreur lors de la récupération des produits: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get(
+    "/products/categories/multiple", tags=["Query"], response_model=List[Product]
+)
+async def search_products_by_multiple_categories_endpoint(
+    categories: List[str] = FastAPIQuery(...),
+    match_all: bool = FastAPIQuery(
+        True, description="True : toutes les catégories ; False : au moins une"
+    ),
+    projection: Optional[dict] = Depends(get_projection),
+):
+    """Recherche les produits appartenant à plusieurs catégories.
+
+    Déclarée avant `/products/categories/{query}`, qui capturerait sinon "multiple".
+    """
+    try:
+        results = await query_instance.search_products_by_multiple_categories(
+            categories, projection, match_all
+        )
+        return projected_response(results, projection)
+    except Exception as e:
+        logging.error(f"Erreur lors de la recherche des produits par catégories: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get(
     "/products/categories/{query}", tags=["Query"], response_model=List[Product]
 )
-async def search_categories_endpoint(query: str, similarity_threshold: int = 80):
+async def search_categories_endpoint(
+    query: str,
+    similarity_threshold: int = 80,
+    projection: Optional[dict] = Depends(get_projection),
+):
     """Recherche floue sur les catégories de produits."""
     try:
-        results = await query_instance.search_categories(query, similarity_threshold)
-        return results
+        results = await query_instance.search_categories(
+            query, similarity_threshold, projection
+        )
+        return projected_response(results, projection)
     except Exception as e:
         logging.error(f"Erreur lors de la recherche des catégories: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -331,11 +422,15 @@ async def search_categories_endpoint(query: str, similarity_threshold: int = 80)
 @router.get(
     "/products/condition/{condition}", tags=["Query"], response_model=List[Product]
 )
-async def search_products_by_condition_endpoint(condition: str):
+async def search_products_by_condition_endpoint(
+    condition: str, projection: Optional[dict] = Depends(get_projection)
+):
     """Recherche les produits par état (condition)."""
     try:
-        results = await query_instance.search_products_by_condition(condition)
-        return results
+        results = await query_instance.search_products_by_condition(
+            condition, projection
+        )
+        return projected_response(results, projection)
     except Exception as e:
         logging.error(f"Erreur lors de la recherche des produits par état: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -344,11 +439,15 @@ async def search_products_by_condition_endpoint(condition: str):
 @router.get(
     "/products/description/{keywords}", tags=["Query"], response_model=List[Product]
 )
-async def search_products_by_description_keywords_endpoint(keywords: str):
+async def search_products_by_description_keywords_endpoint(
+    keywords: str, projection: Optional[dict] = Depends(get_projection)
+):
     """Recherche les produits par mots-clés dans la description."""
     try:
-        results = await query_instance.search_products_by_description_keywords(keywords)
-        return results
+        results = await query_instance.search_products_by_description_keywords(
+            keywords, projection
+        )
+        return projected_response(results, projection)
     except Exception as e:
         logging.error(
             f"Erreur lors de la recherche des produits par mots-clés dans la description: {e}"
@@ -356,29 +455,98 @@ async def search_products_by_description_keywords_endpoint(keywords: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get(
-    "/products/categories/multiple", tags=["Query"], response_model=List[Product]
-)
-async def search_products_by_multiple_categories_endpoint(
-    categories: List[str] = FastAPIQuery(...),
+@router.get("/products/search", tags=["Query"])
+async def search_products_endpoint(
+    source: Optional[str] = None,
+    brand: Optional[str] = None,
+    condition: Optional[str] = FastAPIQuery(
+        None, description="État normalisé (new, very_good, good...)"
+    ),
+    categories: Optional[List[str]] = FastAPIQuery(None),
+    categories_mode: str = FastAPIQuery("all", pattern="^(all|any)$"),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    q: Optional[str] = FastAPIQuery(None, description="Texte recherché dans le nom"),
+    in_stock: Optional[bool] = None,
+    sort: str = FastAPIQuery("id", description="price_asc, price_desc, newest ou id"),
+    limit: int = FastAPIQuery(20, ge=1, le=100),
+    cursor: Optional[str] = FastAPIQuery(
+        None, description="`next_cursor` de la page précédente"
+    ),
+    projection: Optional[dict] = Depends(get_projection),
 ):
-    """Recherche les produits appartenant à plusieurs catégories."""
+    """Recherche multicritère : conjonction des filtres, tri et pagination par clé."""
+    filters = {
+        "source": source,
+        "brand": brand,
+        "condition": condition,
+        "categories": categories,
+        "categories_mode": categories_mode,
+        "min_price": min_price,
+        "max_price": max_price,
+        "text": q,
+        "in_stock": in_stock,
+    }
     try:
-        results = await query_instance.search_products_by_multiple_categories(
-            categories
+        page = await query_instance.search_products(
+            filters, sort, limit, cursor, projection
         )
-        return results
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logging.error(f"Erreur lors de la recherche des produits par catégories: {e}")
+        logging.error(f"Erreur lors de la recherche multicritère: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(content=jsonable_encoder(page))
+
+
+@router.get("/products/facets", tags=["Query"])
+async def get_facets_endpoint(
+    source: Optional[str] = None,
+    brand: Optional[str] = None,
+    condition: Optional[str] = FastAPIQuery(
+        None, description="État normalisé (new, very_good, good...)"
+    ),
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    top_categories: int = FastAPIQuery(20, ge=1, le=200),
+):
+    """Compteurs par source, marque, état, catégorie et tranche de prix (barre de filtres)."""
+    try:
+        return await query_instance.get_facets(
+            source, brand, condition, category, min_price, max_price, top_categories
+        )
+    except Exception as e:
+        logging.error(f"Erreur lors du calcul des facettes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/products/cache/stats", tags=["Query"])
+async def get_query_cache_stats():
+    """Statistiques du cache de résultats des requêtes produits."""
+    if query_instance.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **query_instance.cache.get_stats()}
+
+
+@router.get("/db/metrics", tags=["Query"])
+async def get_db_metrics():
+    """Occupation du pool MongoDB, latence des commandes et file d'écriture des scrapers."""
+    return {**db_manager.get_metrics(), "write_buffer": product_writer.get_stats()}
+
+
 @router.get("/products/page", tags=["Query"], response_model=List[Product])
-async def get_products_with_pagination_endpoint(page: int = 1, page_size: int = 10):
+async def get_products_with_pagination_endpoint(
+    page: int = 1,
+    page_size: int = 10,
+    projection: Optional[dict] = Depends(get_projection),
+):
     """Récupère les produits avec pagination."""
     try:
-        results = await query_instance.get_products_with_pagination(page, page_size)
-        return results
+        results = await query_instance.get_products_with_pagination(
+            page, page_size, projection
+        )
+        return projected_response(results, projection)
     except Exception as e:
         logging.error(
             f"Erreur lors de la récupération des produits avec pagination: {e}"
@@ -395,10 +563,36 @@ class SearchRequest(BaseModel):
 async def search(request: SearchRequest):
     """Recherche un produit dans MongoDB et via RAG."""
     chat_instance = await Chatbot.create()
+    chat_instance.start_background_refresh()
     response = await chat_instance.handle_query(request.query)
     return {"query": request.query, "response": response}
 
 
+@router.post("/bot/stream", tags=["Bot"])
+async def search_stream(request: SearchRequest):
+    """Comme /bot/, mais la réponse est diffusée en server-sent events au fil de la génération."""
+    chat_instance = await Chatbot.create()
+    chat_instance.start_background_refresh()
+
+    async def events():
+        async for chunk in chat_instance.astream_query(request.query):
+            yield f"data: {json.dumps({'token': chunk}, ensure_ascii=False)}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/bot/stats", tags=["Bot"])
+async def bot_stats():
+    """Statistiques du chatbot (taux de succès du cache de réponses)."""
+    chat_instance = await Chatbot.create()
+    return chat_instance.get_stats()
+
+
 # Include the router in the FastAPI application
 app.include_router(router, prefix="/api/v2")
 # Inclusion du routeur pour le chatbot (sans préfixe)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Nombre de points conservés dans l'historique prix/stock de chaque produit
+PRICE_HISTORY_SIZE = int(os.environ.get("PRICE_HISTORY_SIZE", "50"))
+
+# Champs suivis dans `price_history`
+HISTORY_FIELDS = ("price_cents", "stock")
+
+# Champs exclus de l'empreinte : métadonnées d'écriture, et date de mise en
+# ligne relative (« il y a 3 jours ») qui change à chaque scraping sans que
+# l'annonce ait changé
+UNHASHED_FIELDS = {
+    "_id",
+    "revision_id",
+    "updated_at",
+    "last_seen_at",
+    "content_hash",
+    "content_hashes",  # Ancienne empreinte par forme de produit
+    "price_history",
+    "uploaded",
+    "uploaded_at",
+}
+
+# Documents lus en base avant un lot d'écritures : tout sauf l'historique
+EXISTING_PROJECTION = {"price_history": 0}
+
+
+def content_hash(fields: Dict[str, Any]) -> str:
+    """Empreinte canonique (clés triées, champs volatils exclus) d'un produit."""
+    payload = {k: v for k, v in fields.items() if k not in UNHASHED_FIELDS}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def tracked_changed(fields: Dict[str, Any], existing: Optional[Dict[str, Any]]) -> bool:
+    """Vrai si `fields` modifie le prix ou le stock enregistrés (ou crée le produit)."""
+    tracked = {field: fields[field] for field in HISTORY_FIELDS if field in fields}
+    if not tracked:
+        return False
+    return existing is None or any(existing.get(k) != v for k, v in tracked.items())
+
+
+def history_entry(
+    fields: Dict[str, Any], existing: Optional[Dict[str, Any]], now: datetime
+) -> Optional[Dict[str, Any]]:
+    """Point d'historique si le prix ou le stock change (ou à la création), sinon None."""
+    if not tracked_changed(fields, existing):
+        return None
+    tracked = {field: fields[field] for field in HISTORY_FIELDS if field in fields}
+    previous = existing or {}
+    return {
+        "at": now,
+        **{field: tracked.get(field, previous.get(field)) for field in HISTORY_FIELDS},
+    }
+
+
+def plan_update(
+    fields: Dict[str, Any], existing: Optional[Dict[str, Any]], now: datetime
+) -> Optional[Dict[str, Any]]:
+    """Mise à jour MongoDB d'un produit, ou None si son contenu n'a pas changé.
+
+    `fields` contient les champs non nuls, normalisés compris ; `existing` est
+    le document lu avec `EXISTING_PROJECTION` (None pour un nouveau produit).
+    L'empreinte porte sur le document fusionné (base + champs reçus) : une
+    liste de résultats et une fiche détaillée se comparent au même état, et
+    une valeur écrite par l'une puis contredite par l'autre est bien réécrite.
+    """
+    merged = {
+        k: v for k, v in {**(existing or {}), **fields}.items() if v is not None
+    }
+    digest = content_hash(merged)
+    if existing is not None and existing.get("content_hash") == digest:
+        return None
+
+    update: Dict[str, Any] = {
+        "$set": {
+            **fields,
+            "content_hash": digest,
+            "updated_at": now,
+            "last_seen_at": now,
+        }
+    }
+    if existing is not None and "content_hashes" in existing:
+        update["$unset"] = {"content_hashes": ""}
+    entry = history_entry(fields, existing, now)
+    if entry is not None:
+        update["$push"] = {
+            "price_history": {"$each": [entry], "$slice": -PRICE_HISTORY_SIZE}
+        }
+    return update
+
+
+def existing_filter(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Filtre `find` des documents d'un lot, un `$in` par source (index unique)."""
+    by_source: Dict[str, List[str]] = {}
+    for item in items:
+        by_source.setdefault(item["source"], []).append(item["product_id"])
+    return {
+        "$or": [
+            {"source": source, "product_id": {"$in": product_ids}}
+            for source, product_ids in by_source.items()
+        ]
+    }
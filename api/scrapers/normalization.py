@@ -0,0 +1,182 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+# États normalisés des produits
+CONDITION_NEW_WITH_TAGS = "new_with_tags"
+CONDITION_NEW = "new"
+CONDITION_VERY_GOOD = "very_good"
+CONDITION_GOOD = "good"
+CONDITION_SATISFACTORY = "satisfactory"
+CONDITION_UNKNOWN = "unknown"
+
+NEW_CONDITIONS = {CONDITION_NEW_WITH_TAGS, CONDITION_NEW}
+
+# Sources qui ne vendent que du neuf
+NEW_ONLY_SOURCES = {"amazon"}
+
+# Testés dans l'ordre : "comme neuf" / "like new" avant "neuf" / "new", et mots
+# entiers pour que "renewed" ou "reconditionné" ne passent pas pour du neuf
+_CONDITION_PATTERNS = [
+    (r"\bneuf avec etiquettes?\b|\bnew with tags\b", CONDITION_NEW_WITH_TAGS),
+    (r"\btres bon etat\b|\bvery good\b|\bcomme neuf\b|\blike new\b", CONDITION_VERY_GOOD),
+    (r"\bneuf\b|\bnew\b", CONDITION_NEW),
+    (r"\bbon etat\b|\bgood\b", CONDITION_GOOD),
+    (r"\bsatisfaisant\b|\betat correct\b|\bsatisfactory\b|\bfair\b|\bused?\b", CONDITION_SATISFACTORY),
+]
+
+_UNITS = {
+    "seconde": timedelta(seconds=1),
+    "minute": timedelta(minutes=1),
+    "heure": timedelta(hours=1),
+    "jour": timedelta(days=1),
+    "semaine": timedelta(weeks=1),
+    "mois": timedelta(days=30),
+    "an": timedelta(days=365),
+}
+_WORD_NUMBERS = {"un": 1, "une": 1, "quelques": 3}
+
+_CURRENCIES = {"€": "EUR", "eur": "EUR", "$": "USD", "usd": "USD", "£": "GBP", "gbp": "GBP"}
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def parse_price(value) -> Optional[float]:
+    """Convertit un prix au format local ("1 234,50 €", "12,50\xa0€", "€12.50") en nombre."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace("\xa0", " ").replace(" ", " ")
+    match = re.search(r"\d[\d .,]*", text)
+    if not match:
+        return None
+    number = match.group(0).replace(" ", "").rstrip(".,")
+    if "," in number and "." in number:
+        # Le dernier séparateur est le séparateur décimal
+        if number.rfind(",") > number.rfind("."):
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+    elif number.count(",") == 1:
+        number = number.replace(",", ".")
+    elif "," in number:
+        number = number.replace(",", "")
+    elif number.count(".") > 1 or re.fullmatch(r"\d+\.\d{3}", number):
+        # "1.299" : un point suivi de trois chiffres sépare les milliers
+        number = number.replace(".", "")
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def parse_price_cents(value) -> Optional[int]:
+    price = parse_price(value)
+    return int(round(price * 100)) if price is not None else None
+
+
+def parse_currency(value) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    text = value.lower()
+    for symbol, currency in _CURRENCIES.items():
+        if symbol in text:
+            return currency
+    return None
+
+
+def normalize_condition(condition: Optional[str], source: Optional[str] = None) -> str:
+    """Ramène l'état d'un produit à une valeur normalisée (voir CONDITION_*)."""
+    if condition:
+        text = _strip_accents(condition)
+        for pattern, normalized in _CONDITION_PATTERNS:
+            if re.search(pattern, text):
+                return normalized
+    if source in NEW_ONLY_SOURCES:
+        return CONDITION_NEW
+    return CONDITION_UNKNOWN
+
+
+def is_second_hand(condition: str, source: Optional[str] = None) -> bool:
+    if source in NEW_ONLY_SOURCES:
+        return False
+    return condition not in NEW_CONDITIONS
+
+
+def parse_rating(value) -> Optional[float]:
+    """Note numérique à partir d'un texte du type "4,5 sur 5 étoiles"."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d+(?:[.,]\d+)?", str(value))
+    return float(match.group(0).replace(",", ".")) if match else None
+
+
+def parse_uploaded(value) -> Optional[datetime]:
+    """Date de mise en ligne à partir d'une durée relative ("il y a 3 jours").
+
+    `value` est soit `{"scraped": "AAAA-MM-JJ", "time": ...}` tel que produit
+    par le scraper Vinted, soit sa forme aplatie "AAAA-MM-JJ - il y a 3 jours".
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, dict):
+        scraped, text = value.get("scraped"), value.get("time")
+    elif isinstance(value, str):
+        scraped, _, text = value.partition(" - ")
+        if not text:
+            scraped, text = None, value
+    else:
+        return None
+    if not text:
+        return None
+
+    try:
+        reference = datetime.strptime(scraped, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        reference = datetime.now(timezone.utc)
+
+    text = _strip_accents(text)
+    if "instant" in text or "aujourd" in text:
+        return reference
+    if "hier" in text:
+        return reference - timedelta(days=1)
+    match = re.search(r"(\d+|une?|quelques)\s+(seconde|minute|heure|jour|semaine|mois|an)", text)
+    if not match:
+        return None
+    amount = match.group(1)
+    amount = int(amount) if amount.isdigit() else _WORD_NUMBERS[amount]
+    return reference - amount * _UNITS[match.group(2)]
+
+
+def normalize_product(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Champs typés calculés à l'ingestion à partir des champs bruts du scraper.
+
+    Seuls les champs présents dans `item` sont recalculés, pour qu'une mise à
+    jour partielle n'écrase pas les valeurs déjà normalisées.
+    """
+    normalized = {}
+    if "price" in item:
+        normalized["price_cents"] = parse_price_cents(item["price"])
+        normalized["currency"] = parse_currency(item["price"])
+    if "delivery_price" in item:
+        normalized["delivery_price_cents"] = parse_price_cents(item["delivery_price"])
+    if "price_with_protection" in item:
+        normalized["price_with_protection_cents"] = parse_price_cents(
+            item["price_with_protection"]
+        )
+    if "rating" in item:
+        normalized["rating_value"] = parse_rating(item["rating"])
+    if "uploaded" in item:
+        normalized["uploaded_at"] = parse_uploaded(item["uploaded"])
+    if "condition" in item or "source" in item:
+        normalized["condition_normalized"] = normalize_condition(
+            item.get("condition"), item.get("source")
+        )
+    return normalized
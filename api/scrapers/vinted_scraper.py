@@ -11,50 +11,10 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
 from .BaseScraper import BaseScraper
-from api.bd_scraping_arbook.models_scraping import Product_scraping
 from .utils import Product
+from .write_behind import product_collection, product_writer, upsert_products
 logging.basicConfig(level=os.environ.get("LOGLEVEL"))
 
-async def save_to_mongo(db_manager, products: list[dict]):
-    """Insère les produits scrappés dans MongoDB en évitant les doublons (mise à jour si déjà existant)."""
-
-    # Initialiser la base de données si ce n'est pas déjà fait
-    if not db_manager.is_initialized():
-        success = await db_manager.initialize()
-        if not success:
-            logging.error(
-                "Échec de l'initialisation de la base de données. Annulation de l'insertion."
-            )
-            return
-
-    if not products:
-        logging.info("Aucun produit à enregistrer dans MongoDB.")
-        return
-
-    for item in products:
-        try:
-            # Utilisation de Beanie pour insérer ou mettre à jour le produit
-            existing_product = await Product_scraping.find_one(
-                {"product_id": item["product_id"]}
-            )
-            if existing_product:
-                await existing_product.set(item)  # Mise à jour
-                logging.info(
-                    f"Produit {item['name']} ({item['product_id']}) mis à jour avec succès !"
-                )
-            else:
-                new_product = Product_scraping(**item)
-                await new_product.insert()  # Insertion
-                logging.info(
-                    f"Produit {item['name']} ({item['product_id']}) inséré avec succès !"
-                )
-
-        except Exception as e:
-            logging.error(
-                f"Erreur lors de l'insertion du produit {item.get('product_id', 'inconnu')}: {e}"
-            )
-
-
 class VintedScraper(BaseScraper):
 
     BASE_URL = "https://www.vinted.fr"
@@ -124,8 +84,8 @@ class VintedScraper(BaseScraper):
 
             # Sauvegarde dans MongoDB après extraction
             if produits:
-                logging.info(" Enregistrement des produits dans MongoDB...")
-                await save_to_mongo(self.db_manager, produits)
+                logging.info(" Envoi des produits à la file d'écriture MongoDB...")
+                await product_writer.enqueue(produits)
 
         except Exception as e:
             logging.error(f"Erreur lors du scraping de Vinted: {str(e)}")
@@ -390,11 +350,6 @@ class VintedScraper(BaseScraper):
                 logging.warning(" Impossible de récupérer l'ID du produit.")
                 return {}
 
-            #  Vérifier que MongoDB est bien initialisé
-            if not self.db_manager.is_initialized():
-                logging.info("🛠️ Initialisation de MongoDB avec Beanie...")
-                await self.db_manager.initialize()
-
             #  Correction : Convertir `uploaded` en `str` si c'est un `dict`
             if "uploaded" in detailed_product and isinstance(
                 detailed_product["uploaded"], dict
@@ -404,39 +359,21 @@ class VintedScraper(BaseScraper):
                     f"{uploaded_data.get('scraped', 'N/A')} - {uploaded_data.get('time', 'N/A')}"
                 )
 
-            #  Rechercher si le produit existe déjà en base
-            existing_product = await Product_scraping.find_one(
-                {"product_id": product_id}
-            )
-
-            if existing_product:
-                updated_fields = {
-                    k: v
-                    for k, v in detailed_product.items()
-                    if getattr(existing_product, k, None) != v and v is not None
-                }
-
-                if updated_fields:
-                    try:
-                        await existing_product.set(updated_fields)
-                        logging.info(
-                            f" Produit {product_id} mis à jour avec {len(updated_fields)} nouvelles valeurs."
-                        )
-                    except Exception as e:
-                        logging.error(
-                            f" Erreur lors de la mise à jour du produit `{product_id}` dans MongoDB : {e}"
-                        )
-                else:
+            #  Écriture ignorée si l'empreinte du contenu n'a pas changé
+            try:
+                collection = await product_collection(self.db_manager)
+                result = await upsert_products(collection, [detailed_product])
+                if result["changed"]:
+                    logging.info(f" Produit {product_id} enregistré en base.")
+                elif result["retry"]:
+                    #  Erreur passagère : réécriture confiée à la file d'écriture
+                    await product_writer.enqueue(result["retry"])
+                elif not result["dropped"]:
                     logging.info(f"ℹ️ Aucun changement détecté pour {product_id}.")
-            else:
-                try:
-                    new_product = Product_scraping(**detailed_product)
-                    await new_product.insert()
-                    logging.info(f" Produit {product_id} ajouté en base.")
-                except Exception as e:
-                    logging.error(
-                        f" Erreur lors de l'insertion du produit `{product_id}` dans MongoDB : {e}"
-                    )
+            except Exception as e:
+                logging.error(
+                    f" Erreur lors de l'enregistrement du produit `{product_id}` dans MongoDB : {e}"
+                )
 
             return detailed_product
 
@@ -462,11 +399,6 @@ class VintedScraper(BaseScraper):
                 logging.warning(" Impossible de récupérer l'ID du produit.")
                 return {}
 
-            #  Vérifier que MongoDB est bien initialisé
-            if not self.db_manager.is_initialized():
-                logging.info("🛠️ Initialisation de MongoDB avec Beanie...")
-                await self.db_manager.initialize()
-
             #  Correction : Convertir `uploaded` en `str` si c'est un `dict`
             if "uploaded" in detailed_product and isinstance(
                 detailed_product["uploaded"], dict
@@ -476,39 +408,21 @@ class VintedScraper(BaseScraper):
                     f"{uploaded_data.get('scraped', 'N/A')} - {uploaded_data.get('time', 'N/A')}"
                 )
 
-            #  Rechercher si le produit existe déjà en base
-            existing_product = await Product_scraping.find_one(
-                {"product_id": product_id}
-            )
-
-            if existing_product:
-                updated_fields = {
-                    k: v
-                    for k, v in detailed_product.items()
-                    if getattr(existing_product, k, None) != v and v is not None
-                }
-
-                if updated_fields:
-                    try:
-                        await existing_product.set(updated_fields)
-                        logging.info(
-                            f" Produit {product_id} mis à jour avec {len(updated_fields)} nouvelles valeurs."
-                        )
-                    except Exception as e:
-                        logging.error(
-                            f" Erreur lors de la mise à jour du produit `{product_id}` dans MongoDB : {e}"
-                        )
-                else:
+            #  Écriture ignorée si l'empreinte du contenu n'a pas changé
+            try:
+                collection = await product_collection(self.db_manager)
+                result = await upsert_products(collection, [detailed_product])
+                if result["changed"]:
+                    logging.info(f" Produit {product_id} enregistré en base.")
+                elif result["retry"]:
+                    #  Erreur passagère : réécriture confiée à la file d'écriture
+                    await product_writer.enqueue(result["retry"])
+                elif not result["dropped"]:
                     logging.info(f"ℹ️ Aucun changement détecté pour {product_id}.")
-            else:
-                try:
-                    new_product = Product_scraping(**detailed_product)
-                    await new_product.insert()
-                    logging.info(f" Produit {product_id} ajouté en base.")
-                except Exception as e:
-                    logging.error(
-                        f" Erreur lors de l'insertion du produit `{product_id}` dans MongoDB : {e}"
-                    )
+            except Exception as e:
+                logging.error(
+                    f" Erreur lors de l'enregistrement du produit `{product_id}` dans MongoDB : {e}"
+                )
 
             return detailed_product
 
@@ -0,0 +1,360 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from api.bd_scraping_arbook.cache import bump_catalog_version
+from api.bd_scraping_arbook.database import DatabaseManager
+from api.bd_scraping_arbook.indexes import PRODUCT_COLLECTION
+from .change_detection import EXISTING_PROJECTION, existing_filter, plan_update
+from .normalization import CONDITION_UNKNOWN, normalize_product
+
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+# Écriture en bloc dès que ce nombre de produits est en attente...
+WRITE_BUFFER_FLUSH_SIZE = int(os.environ.get("WRITE_BUFFER_FLUSH_SIZE", "500"))
+# ... ou au plus tard après ce délai
+WRITE_BUFFER_FLUSH_MS = int(os.environ.get("WRITE_BUFFER_FLUSH_MS", "1000"))
+# Au-delà, `enqueue` attend qu'une écriture libère de la place (backpressure)
+WRITE_BUFFER_MAX_PENDING = int(os.environ.get("WRITE_BUFFER_MAX_PENDING", "10000"))
+WRITE_BUFFER_ENQUEUE_TIMEOUT = float(os.environ.get("WRITE_BUFFER_ENQUEUE_TIMEOUT", "5"))
+# Fichier JSONL de secours (MongoDB indisponible ou file pleine) ; vide = désactivé
+WRITE_BUFFER_SPILL_PATH = os.environ.get(
+    "WRITE_BUFFER_SPILL_PATH", "./write_buffer/products_spill.jsonl"
+)
+
+# Codes d'erreur d'écriture passagers (bascule du primaire, réseau, conflit
+# d'upserts concurrents sur l'index unique) : l'opération est rejouée. Les
+# autres (document invalide, trop volumineux...) échoueraient à nouveau.
+TRANSIENT_WRITE_ERRORS = {
+    6,  # HostUnreachable
+    7,  # HostNotFound
+    50,  # MaxTimeMSExpired
+    89,  # NetworkTimeout
+    91,  # ShutdownInProgress
+    112,  # WriteConflict
+    189,  # PrimarySteppedDown
+    262,  # ExceededTimeLimit
+    9001,  # SocketException
+    10107,  # NotWritablePrimary
+    11000,  # DuplicateKey (deux upserts simultanés du même produit)
+    11600,  # InterruptedAtShutdown
+    11602,  # InterruptedDueToReplStateChange
+    13435,  # NotPrimaryNoSecondaryOk
+    13436,  # NotPrimaryOrSecondary
+}
+
+
+async def upsert_products(collection, items: List[dict]) -> Dict[str, int]:
+    """Upsert en bloc, par (source, product_id), des produits scrappés.
+
+    Les champs à None ne sont pas écrits : une liste de résultats de recherche
+    n'efface pas les détails déjà récupérés pour le produit. Les produits dont
+    l'empreinte n'a pas changé ne reçoivent que `last_seen_at`, en une requête.
+    Les documents existants sont relus en entier (hors `price_history`) pour
+    calculer l'empreinte du document fusionné.
+    En cas d'échec partiel, `retry` liste les produits à réécrire (erreurs
+    passagères) et `dropped` compte ceux abandonnés (erreurs définitives).
+    """
+    result = {"changed": 0, "unchanged": 0, "retry": [], "dropped": 0}
+    if not items:
+        return result
+    now = datetime.now(timezone.utc)
+    existing = {
+        (doc["source"], doc["product_id"]): doc
+        async for doc in collection.find(existing_filter(items), EXISTING_PROJECTION)
+    }
+
+    operations, operation_items, unchanged_ids = [], [], []
+    for item in items:
+        fields = {k: v for k, v in item.items() if v is not None}
+        normalized = normalize_product(fields)
+        current = existing.get((item["source"], item["product_id"]))
+        if (
+            current is not None
+            and "condition" not in fields
+            and normalized.get("condition_normalized") == CONDITION_UNKNOWN
+        ):
+            # État absent de la liste : ne pas écraser celui issu de la fiche détaillée
+            normalized.pop("condition_normalized")
+        update = plan_update({**fields, **normalized}, current, now)
+        if update is None:
+            unchanged_ids.append(current["_id"])
+            continue
+        operations.append(
+            UpdateOne(
+                {"source": item["source"], "product_id": item["product_id"]},
+                update,
+                upsert=True,
+            )
+        )
+        operation_items.append(item)
+
+    if unchanged_ids:
+        await collection.update_many(
+            {"_id": {"$in": unchanged_ids}}, {"$set": {"last_seen_at": now}}
+        )
+    result["unchanged"] = len(unchanged_ids)
+    if operations:
+        failed = 0
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # `ordered=False` : les autres opérations du lot ont été appliquées
+            for error in e.details.get("writeErrors", []):
+                failed += 1
+                item = operation_items[error["index"]]
+                if error.get("code") in TRANSIENT_WRITE_ERRORS:
+                    result["retry"].append(item)
+                else:
+                    result["dropped"] += 1
+                    logging.error(
+                        f"Produit {item['source']}/{item['product_id']} abandonné "
+                        f"(code {error.get('code')}) : {error.get('errmsg')}"
+                    )
+            for error in e.details.get("writeConcernErrors", []):
+                logging.warning(f"Write concern non satisfait : {error.get('errmsg')}")
+        result["changed"] = len(operations) - failed
+        if result["changed"]:
+            # Invalide les caches de lecture calculés avant ces écritures
+            await bump_catalog_version()
+    return result
+
+
+async def product_collection(db_manager: DatabaseManager):
+    """Collection Motor des produits, en initialisant la connexion si besoin."""
+    if not db_manager.is_initialized() and not await db_manager.initialize():
+        raise ConnectionError("MongoDB n'est pas initialisé.")
+    return db_manager.get_client()[db_manager.database_name][PRODUCT_COLLECTION]
+
+
+class WriteBehindBuffer:
+    """File d'écriture différée des produits scrappés vers MongoDB.
+
+    Les scrapers déposent leurs produits et reprennent la main aussitôt ; une
+    tâche de fond fusionne les doublons par (source, product_id) et écrit en
+    bloc tous les `flush_size` produits ou toutes les `flush_interval_ms` ms.
+    Si MongoDB est indisponible, ou si la file reste pleine, les produits sont
+    ajoutés au fichier de secours, rejoué dès que les écritures réussissent.
+    """
+
+    def __init__(
+        self,
+        db_manager: Optional[DatabaseManager] = None,
+        flush_size: int = WRITE_BUFFER_FLUSH_SIZE,
+        flush_interval_ms: int = WRITE_BUFFER_FLUSH_MS,
+        max_pending: int = WRITE_BUFFER_MAX_PENDING,
+        enqueue_timeout: float = WRITE_BUFFER_ENQUEUE_TIMEOUT,
+        spill_path: str = WRITE_BUFFER_SPILL_PATH,
+    ):
+        self.db_manager = db_manager or DatabaseManager()
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.spill_path = spill_path
+        self._pending: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self._wake = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._failures = 0
+        self.stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "written": 0,
+            "unchanged": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "backpressure_waits": 0,
+        }
+
+    # --- Dépôt ---------------------------------------------------------------
+
+    def _merge(self, item: dict):
+        key = (item.get("source"), item.get("product_id"))
+        previous = self._pending.get(key)
+        if previous is not None:
+            # Les valeurs récentes non nulles remplacent les anciennes
+            previous.update({k: v for k, v in item.items() if v is not None})
+            self.stats["coalesced"] += 1
+        else:
+            self._pending[key] = dict(item)
+
+    async def enqueue(self, products: List[dict]):
+        """Dépose des produits à écrire ; n'attend que si la file est pleine."""
+        products = [p for p in products if p.get("source") and p.get("product_id")]
+        if not products:
+            return
+        if self._task is None:
+            # File non démarrée (scripts, tests) : écriture directe
+            await self._write(products)
+            return
+
+        if len(self._pending) >= self.max_pending:
+            self.stats["backpressure_waits"] += 1
+            self._wake.set()
+            try:
+                await asyncio.wait_for(self._space.wait(), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                if self.spill_path:
+                    logging.warning(
+                        f"File d'écriture pleine : {len(products)} produits mis de côté sur disque."
+                    )
+                    self._spill(products)
+                    return
+                await self._space.wait()
+
+        for product in products:
+            self._merge(product)
+        self.stats["enqueued"] += len(products)
+        if len(self._pending) >= self.max_pending:
+            self._space.clear()
+        if len(self._pending) >= self.flush_size:
+            self._wake.set()
+
+    # --- Écriture ------------------------------------------------------------
+
+    def _keep(self, items: List[dict]):
+        """Met de côté des produits non écrits : sur disque, ou à défaut dans la file."""
+        if self.spill_path:
+            self._spill(items)
+        else:
+            for item in items:
+                self._pending.setdefault((item["source"], item["product_id"]), item)
+
+    async def _write(self, items: List[dict]):
+        """Écrit un lot ; en cas d'échec, met de côté les produits non écrits."""
+        done = 0
+        retry = []
+        try:
+            collection = await product_collection(self.db_manager)
+            for done in range(0, len(items), self.flush_size):
+                result = await upsert_products(collection, items[done : done + self.flush_size])
+                self.stats["written"] += result["changed"]
+                self.stats["unchanged"] += result["unchanged"]
+                self.stats["dropped"] += result["dropped"]
+                retry += result["retry"]
+        except asyncio.CancelledError:
+            # Annulation (arrêt brutal) : le lot en cours ne doit pas être perdu
+            self._keep(retry + items[done:])
+            raise
+        except Exception as e:
+            self._failures += 1
+            self.stats["failed_flushes"] += 1
+            logging.error(f"Écriture de {len(items) - done} produits impossible : {e}")
+            self._keep(retry + items[done:])
+            return False
+
+        if retry:
+            self._failures += 1
+            self.stats["failed_flushes"] += 1
+            logging.warning(f"{len(retry)} produits seront réécrits (erreur passagère).")
+            self._keep(retry)
+            return False
+        self._failures = 0
+        return True
+
+    async def flush(self):
+        """Écrit tous les produits en attente, puis rejoue le fichier de secours."""
+        async with self._flush_lock:
+            if self._pending:
+                items = list(self._pending.values())
+                self._pending.clear()
+                self._space.set()
+                self.stats["flushes"] += 1
+                if not await self._write(items):
+                    return
+            if self.spill_path and (
+                os.path.exists(self.spill_path) or os.path.exists(f"{self.spill_path}.replay")
+            ):
+                await self._replay_spill()
+
+    async def _run(self):
+        while not self._stopping:
+            # Attente exponentielle tant que MongoDB est indisponible
+            delay = self.flush_interval * (2 ** min(self._failures, 6))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Erreur de la file d'écriture : {e}")
+
+    # --- Fichier de secours ----------------------------------------------------
+
+    def _spill(self, items: List[dict]):
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as file:
+            for item in items:
+                file.write(json_util.dumps(item) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.stats["spilled"] += len(items)
+
+    async def _replay_spill(self):
+        # Le fichier renommé survit à un arrêt brutal pendant le rejeu
+        replay_path = f"{self.spill_path}.replay"
+        if not os.path.exists(replay_path):
+            os.replace(self.spill_path, replay_path)
+        with open(replay_path, "r", encoding="utf-8") as file:
+            items: Dict[tuple, dict] = {}
+            for line in file:
+                if line.strip():
+                    item = json_util.loads(line)
+                    items.setdefault((item["source"], item["product_id"]), {}).update(item)
+        logging.info(f"Rejeu de {len(items)} produits mis de côté sur disque.")
+        # En cas d'échec, `_write` les remet dans le fichier de secours
+        if await self._write(list(items.values())):
+            self.stats["replayed"] += len(items)
+        os.remove(replay_path)
+
+    # --- Cycle de vie ----------------------------------------------------------
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            if self.spill_path and (
+                os.path.exists(self.spill_path) or os.path.exists(f"{self.spill_path}.replay")
+            ):
+                self._wake.set()
+
+    async def stop(self):
+        """Arrête la tâche de fond après une dernière écriture."""
+        if self._task is None:
+            return
+        # Pas d'annulation : l'écriture en cours se termine (ou est mise de côté)
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        if self._pending and self.spill_path:
+            self._spill(list(self._pending.values()))
+            self._pending.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "running": self._task is not None,
+            "pending": len(self._pending),
+            "consecutive_failures": self._failures,
+        }
+
+
+product_writer = WriteBehindBuffer()
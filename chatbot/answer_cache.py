@@ -0,0 +1,157 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Set
+import logging
+import os
+import re
+import time
+import unicodedata
+
+import numpy as np
+
+# Configuration des logs
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+# Similarité cosinus minimale pour réutiliser la réponse d'une question voisine
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.97"))
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    product_ids: Set[str]
+    vector: Optional[np.ndarray]
+    expires_at: float
+    scope: str = ""
+    hits: int = field(default=0)
+
+
+class AnswerCache:
+    """Cache des réponses du chatbot : correspondance exacte puis sémantique.
+
+    Éviction LRU + TTL. Une réponse est invalidée dès qu'un des produits
+    utilisés pour la construire est modifié ou supprimé de l'index. Le
+    `scope` (filtres extraits de la question) doit être identique pour
+    qu'une question voisine réutilise une réponse : « moins de 20 € » et
+    « moins de 30 € » sont sémantiquement proches mais pas équivalentes.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        max_size: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Minuscules, sans accents ni ponctuation, espaces compactés."""
+        query = unicodedata.normalize("NFKD", query.lower())
+        query = "".join(c for c in query if not unicodedata.combining(c))
+        query = re.sub(r"[^\w\s€]", " ", query)
+        return " ".join(query.split())
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            del self._entries[key]
+            self.stats["evictions"] += 1
+
+    async def _embed(self, normalized: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.aembed_query(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @classmethod
+    def _key(cls, query: str, scope: str) -> str:
+        return f"{scope}\0{cls.normalize(query)}"
+
+    async def get(self, query: str, scope: str = "") -> Optional[str]:
+        self._purge_expired()
+        key = self._key(query, scope)
+
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.stats["exact_hits"] += 1
+            return entry.answer
+
+        candidates = [
+            (k, e)
+            for k, e in self._entries.items()
+            if e.vector is not None and e.scope == scope
+        ]
+        if candidates:
+            vector = await self._embed(self.normalize(query))
+            matrix = np.stack([e.vector for _, e in candidates])
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                best_key, entry = candidates[best]
+                self._entries.move_to_end(best_key)
+                entry.hits += 1
+                self.stats["semantic_hits"] += 1
+                return entry.answer
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(
+        self, query: str, answer: str, product_ids: Iterable[str], scope: str = ""
+    ):
+        key = self._key(query, scope)
+        try:
+            vector = await self._embed(self.normalize(query))
+        except Exception as e:
+            # Sans vecteur, l'entrée reste utilisable en correspondance exacte
+            logging.warning(f"Embedding de la question impossible pour le cache : {e}")
+            vector = None
+        self._entries[key] = CachedAnswer(
+            answer=answer,
+            product_ids=set(product_ids),
+            vector=vector,
+            expires_at=time.monotonic() + self.ttl,
+            scope=scope,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate_products(self, product_ids: Iterable[str], docs=None):
+        """Supprime les réponses construites à partir des produits modifiés."""
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+        stale = [k for k, e in self._entries.items() if e.product_ids & product_ids]
+        for key in stale:
+            del self._entries[key]
+        self.stats["invalidations"] += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
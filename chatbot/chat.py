@@ -1,108 +1,248 @@
 from api.bd_scraping_arbook.database import DatabaseManager
+from api.bd_scraping_arbook.indexes import PRODUCT_COLLECTION
 import os
+import asyncio
 import logging
+from bson import ObjectId
 from langchain.chains import RetrievalQA
 from langchain_openai import ChatOpenAI
 from .chromadb import ChromaManager
+from .answer_cache import AnswerCache
+from .embeddings import get_embeddings
+from .hybrid_retriever import HybridRetriever, KeywordIndex
+from .query_filters import parse_query_filters
+from .context_builder import ContextBuilder
 from langchain.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
 # Configure logging
 logging.basicConfig(level=os.environ.get("LOGLEVEL"))
 
+# Intervalle (s) entre deux synchronisations MongoDB -> ChromaDB en arrière-plan
+CHATBOT_REFRESH_INTERVAL = float(os.environ.get("CHATBOT_REFRESH_INTERVAL", "300"))
+# Suivi des modifications MongoDB en continu (change stream, replica set requis)
+CHROMA_CHANGE_STREAM = os.environ.get("CHROMA_CHANGE_STREAM", "False").lower() == "true"
+
+TEMPLATE = """
+        Tu es un assistant de vente en ligne expert, conçu pour aider les clients à trouver les produits qu'ils recherchent.
+
+        Un client te pose une question ou cherche un produit spécifique. Voici les informations sur les produits disponibles :
+
+        {context}
+
+        Question du client : {question}
+
+        Important :
+            Pour chaque produit pertinent, formate les informations suivantes comme indiqué :
+            <produit>
+                <id>{{_id}}</id>
+                <source>{{source}}</source>
+                <product_id>{{product_id}}</product_id>
+            </produit>
+
+        Réponds à la question du client en utilisant les informations fournies, en te concentrant sur le nom et la description des produits. Si plusieurs produits similaires sont disponibles, liste-les de manière claire et concise, en mettant en évidence leurs principales caractéristiques et différences.
+        Si la question du client ne concerne pas directement les produits disponibles, réponds de manière informative et professionnelle, en précisant que tu ne peux pas fournir d'informations supplémentaires en dehors des produits présents dans ta base de données.
+
+        Remarques Importantes :
+            - Ne donne pas de lien dans ta reponse.
+            - Considère un produit comme étant de "seconde main" si sa source n'est pas une source de produits neufs.
+            - Limite ta réponse à 3 produits." \
+        """
+
 
 class Chatbot:
-    _inited = False
+    """Service de chatbot partagé par tout le processus (voir `create`)."""
+
+    _instance = None
+    _lock = None
 
     def __init__(self):
         self.collection = None
         self.llm = ChatOpenAI(model="gpt-4", temperature=0)
         self.chroma_db = None
+        self.retriever = None
+        self.rag_chain = None
+        self.answer_cache = None
+        self.keyword_index = None
+        self.context_builder = ContextBuilder(model=self.llm.model_name)
+        self._inited = False
+        self._refresh_task = None
+        self._watch_task = None
 
     async def initialize(self):
         if not self._inited:
             await self.init_db()
             await self.init_chroma()
+            self.build_chain()
             self._inited = True
         else:
             logging.info("Chatbot déjà initialisé")
 
     @classmethod
     async def create(cls):
-        instance = cls()
-        await instance.initialize()
-        return instance
+        """Retourne l'instance unique du chatbot, initialisée une seule fois."""
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        async with cls._lock:
+            if cls._instance is None:
+                instance = cls()
+                await instance.initialize()
+                cls._instance = instance
+        return cls._instance
+
+    def start_background_refresh(self, interval: float = CHATBOT_REFRESH_INTERVAL):
+        """Lance la mise à jour périodique de l'index vectoriel hors du chemin des requêtes."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop(interval))
+        if CHROMA_CHANGE_STREAM and not self.chroma_db.read_only and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self.chroma_db.watch_changes())
+
+    async def stop_background_refresh(self):
+        for task in (self._refresh_task, self._watch_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._refresh_task = None
+        self._watch_task = None
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.chroma_db.update_if_needed():
+                    await self.on_index_swap()
+                elif self.rag_chain is None:
+                    self.build_chain()
+            except Exception as e:
+                logging.error(f"Erreur lors de la mise à jour de ChromaDB: {e}")
+
+    async def on_index_swap(self):
+        """Nouvelle version de l'index (mode snapshot) : index BM25, cache et chaîne reconstruits."""
+        keyword_index = KeywordIndex()
+        await keyword_index.build(self.collection)
+        self.keyword_index = keyword_index
+        self.answer_cache.clear()
+        self.build_chain()
 
     async def init_db(self):
         db_manager = DatabaseManager()
         await db_manager.initialize()
         client = db_manager.get_client()
-        self.collection = client["scraping_arbook"]["Product_scraping"]
+        self.collection = client[db_manager.database_name][PRODUCT_COLLECTION]
 
     async def init_chroma(self):
         self.chroma_db = ChromaManager(self.collection)
         await self.chroma_db.initialize()
+        self.answer_cache = AnswerCache(get_embeddings())
+        self.chroma_db.add_listener(self.answer_cache.invalidate_products)
+        self.keyword_index = KeywordIndex()
+        await self.keyword_index.build(self.collection)
+        self.chroma_db.add_listener(self.keyword_index.on_index_change)
 
-    def format_docs(self, docs):
-        return "\n\n".join(doc.page_content for doc in docs)
+    async def build_context(self, query, docs):
+        """Contexte compact des produits retrouvés, relus dans MongoDB sous un budget de tokens."""
+        object_ids = [ObjectId(doc.id) for doc in docs if ObjectId.is_valid(doc.id)]
+        products = {
+            str(p["_id"]): p
+            async for p in self.collection.find(
+                {"_id": {"$in": object_ids}}, self.context_builder.projection
+            )
+        }
+        context, context_tokens = self.context_builder.build(
+            [products[doc.id] for doc in docs if doc.id in products]
+        )
+        prompt_tokens = self.context_builder.count_tokens(
+            TEMPLATE.format(context=context, question=query)
+        )
+        self.context_builder.record(prompt_tokens, context_tokens)
+        return context
 
-    async def retrieve(self, query):
-        await self.chroma_db.update_if_needed()
+    def build_chain(self):
+        """Construit la chaîne RAG une fois l'index vectoriel disponible."""
         vector_store = self.chroma_db.get_vector_store()
         if not vector_store:
-            return "La base de données vectorielle n'est pas initialisée."
+            return None
 
-        template = """
-        Tu es un assistant de vente en ligne expert, conçu pour aider les clients à trouver les produits qu'ils recherchent.
+        prompt = ChatPromptTemplate.from_template(TEMPLATE)
+        self.retriever = HybridRetriever(vector_store, self.keyword_index)
+        # La recherche est séparée de la génération pour connaître les produits utilisés
+        self.rag_chain = prompt | self.llm | StrOutputParser()
+        return self.rag_chain
 
-        Un client te pose une question ou cherche un produit spécifique. Voici les informations sur les produits disponibles :
-
-        {context}
-
-        Question du client : {question}
-
-        Important :
-            Pour chaque produit pertinent, formate les informations suivantes comme indiqué :
-            <produit>
-                <id>{{_id}}</id>
-                <source>{{source}}</source>
-                <product_id>{{product_id}}</product_id>
-            </produit>
+    async def retrieve(self, query):
+        if self.rag_chain is None and not self.build_chain():
+            return "La base de données vectorielle n'est pas initialisée."
 
-        Réponds à la question du client en utilisant les informations fournies, en te concentrant sur le nom et la description des produits. Si plusieurs produits similaires sont disponibles, liste-les de manière claire et concise, en mettant en évidence leurs principales caractéristiques et différences.
-        Si la question du client ne concerne pas directement les produits disponibles, réponds de manière informative et professionnelle, en précisant que tu ne peux pas fournir d'informations supplémentaires en dehors des produits présents dans ta base de données.
+        try:
+            where, search_query = parse_query_filters(query)
+            scope = repr(where)
+            cached = await self.answer_cache.get(query, scope)
+            if cached is not None:
+                return cached
 
-        Remarques Importantes :
-            - Ne donne pas de lien dans ta reponse.
-            - Considère un produit comme étant de "seconde main" si sa source n'est pas une source de produits neufs.
-            - Limite ta réponse à 3 produits." \
-        """
+            docs = await self.retriever.ainvoke(search_query, where)
+            answer = await self.rag_chain.ainvoke(
+                {"context": await self.build_context(query, docs), "question": query}
+            )
+            await self.answer_cache.put(query, answer, [doc.id for doc in docs], scope)
+            return answer
+        except Exception as e:
+            logging.error(f"Erreur lors de la récupération du contexte: {e}")
+            return f"Erreur lors de la récupération du contexte: {e}"
 
-        prompt = ChatPromptTemplate.from_template(template)
-        retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-        llm = self.llm
-        rag_chain = (
-            {"context": retriever | self.format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
+    async def astream_retrieve(self, query):
+        """Version en flux de `retrieve` : produit les tokens au fil de la génération."""
+        if self.rag_chain is None and not self.build_chain():
+            yield "La base de données vectorielle n'est pas initialisée."
+            return
 
         try:
-            return rag_chain.invoke(query)
+            where, search_query = parse_query_filters(query)
+            scope = repr(where)
+            cached = await self.answer_cache.get(query, scope)
+            if cached is not None:
+                yield cached
+                return
+
+            docs = await self.retriever.ainvoke(search_query, where)
+            chunks = []
+            context = await self.build_context(query, docs)
+            async for chunk in self.rag_chain.astream(
+                {"context": context, "question": query}
+            ):
+                chunks.append(chunk)
+                yield chunk
+            await self.answer_cache.put(
+                query, "".join(chunks), [doc.id for doc in docs], scope
+            )
         except Exception as e:
             logging.error(f"Erreur lors de la récupération du contexte: {e}")
-            return f"Erreur lors de la récupération du contexte: {e}"
+            yield f"Erreur lors de la récupération du contexte: {e}"
+
+    def get_stats(self):
+        return {
+            "answer_cache": self.answer_cache.get_stats() if self.answer_cache else None,
+            "prompt_tokens": self.context_builder.get_stats(),
+        }
+
+    async def find_exact_product(self, query):
+        """Réponse directe si la question correspond au nom d'un produit."""
+        doc_id = self.keyword_index.exact(query) if self.keyword_index else None
+        if doc_id is None:
+            return None
+        result = await self.collection.find_one({"_id": ObjectId(doc_id)})
+        if result:
+            return f"{result['name']} - {result['description']} \nPrice : {result.get('price', 'Non précisé')}€\n Stock : {result.get('stock', 'Non précisé')}"
+        return None
 
     async def handle_query(self, query):
         try:
-            result = await self.collection.find_one(
-                {"name": {"$regex": query, "$options": "i"}}
-            )
-
+            result = await self.find_exact_product(query)
             if result:
-                return f"{result['name']} - {result['description']} \nPrice : {result.get('price', 'Non précisé')}€\n Stock : {result.get('stock', 'Non précisé')}"
+                return result
 
             alternative = await self.retrieve(query)
             return alternative if alternative else "Produit non disponible."
@@ -110,3 +250,18 @@ class Chatbot:
         except Exception as e:
             logging.error(f"Erreur lors du traitement de votre demande: {e}")
             return f"Erreur lors du traitement de votre demande: {e}"
+
+    async def astream_query(self, query):
+        """Comme `handle_query`, mais renvoie la réponse token par token."""
+        try:
+            result = await self.find_exact_product(query)
+            if result:
+                yield result
+                return
+
+            async for chunk in self.astream_retrieve(query):
+                yield chunk
+
+        except Exception as e:
+            logging.error(f"Erreur lors du traitement de votre demande: {e}")
+            yield f"Erreur lors du traitement de votre demande: {e}"
@@ -1,43 +1,88 @@
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from .embeddings import (
+    get_embeddings,
+    collection_name as embedding_collection_name,
+    embedding_model_name,
+)
+from api.scrapers.normalization import parse_price, normalize_condition, is_second_hand
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import OperationFailure
+from datetime import datetime
+import asyncio
+import hashlib
 import os
 import logging
 import json
+import time
 
 # Configuration des logs
 logging.basicConfig(level=os.environ.get("LOGLEVEL"))
 
+# "live" : index synchronisé par l'API ; "snapshot" : index construit hors ligne
+# (scripts/build_vector_index.py) et chargé en lecture seule
+CHROMA_INDEX_MODE = os.environ.get("CHROMA_INDEX_MODE", "live")
+CHROMA_SNAPSHOT_ROOT = os.environ.get("CHROMA_SNAPSHOT_ROOT", "./chroma_snapshots")
+MANIFEST_FILE = "manifest.json"
+PUBLISHED_FILE = "PUBLISHED"
 
-class ChromaManager:
-    """Gère l'initialisation et la mise à jour de la base de données vectorielle ChromaDB."""
 
-    _instance = None
-    _initialized = False
-    _vector_store = None
-    persist_directory = "./chroma_db"
+def current_snapshot(root=CHROMA_SNAPSHOT_ROOT):
+    """Version pointée par le fichier CURRENT, ou None."""
+    try:
+        with open(os.path.join(root, "CURRENT"), "r") as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
 
-    def __new__(cls, collection, *args, **kwargs):
-        """Crée une instance unique de ChromaManager et stocke la collection MongoDB."""
-        if cls._instance is None:
-            cls._instance = super(ChromaManager, cls).__new__(cls)
-            cls._instance.collection = collection
-        return cls._instance
 
-    async def __format_texts(self, products):
-        """Formate les données des produits en texte pour l'intégration vectorielle."""
+def publish_snapshot(root, version):
+    """Bascule atomiquement le pointeur CURRENT vers `version`.
+
+    La date de publication est notée dans la version (PUBLISHED_FILE) : la
+    purge s'en sert pour savoir depuis quand une version n'est plus courante.
+    """
+    tmp_file = os.path.join(root, "CURRENT.tmp")
+    with open(tmp_file, "w") as file:
+        file.write(version)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, os.path.join(root, "CURRENT"))
+    with open(os.path.join(root, version, PUBLISHED_FILE), "w") as file:
+        file.write(str(time.time()))
+
+
+def published_at(snapshot_dir):
+    """Date (epoch) de publication d'une version, ou None si jamais publiée."""
+    try:
+        with open(os.path.join(snapshot_dir, PUBLISHED_FILE), "r") as file:
+            return float(file.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
 
-        def format_value(value):
-            if isinstance(value, list):
-                return ", ".join(map(str, value))
-            elif isinstance(value, dict):
-                return json.dumps(value, ensure_ascii=False)
-            elif value is None:
-                return "Non disponible."
-            else:
-                return str(value)
-
-        return [
-            f"""
+
+def format_value(value):
+    if isinstance(value, list):
+        return ", ".join(map(str, value))
+    elif isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    elif value is None:
+        return "Non disponible."
+    else:
+        return str(value)
+
+
+def format_product_text(p):
+    """Formate un produit en texte pour l'intégration vectorielle."""
+    return f"""
             # Nom du produit/description: {format_value(p.get('name'))}
             * _id: {format_value(p.get('_id'))}
             * source: {format_value(p.get('source'))}
@@ -53,43 +98,305 @@ class ChromaManager:
             * Caractéristiques/Description 1: {format_value(p.get('feature_table'))}
             * Caractéristiques/Description 2: {format_value(p.get('feature_bullet'))}
             """
-            for p in products
-        ]
 
-    async def __add_new_documents(self):
-        """Ajoute les nouveaux documents de MongoDB à ChromaDB."""
+
+def product_metadata(p):
+    """Métadonnées filtrables (`where`) stockées avec le vecteur du produit.
+
+    Chroma refuse les valeurs nulles : les champs inconnus sont omis.
+    """
+    source = p.get("source")
+    condition = normalize_condition(p.get("condition"), source)
+    metadata = {
+        "condition": condition,
+        "second_hand": is_second_hand(condition, source),
+    }
+    if source:
+        metadata["source"] = source
+    price = parse_price(p.get("price"))
+    if price is not None:
+        metadata["price"] = price
+    if isinstance(p.get("stock"), bool):
+        metadata["stock"] = p["stock"]
+    return metadata
+
+
+class ChromaManager:
+    """Gère l'initialisation et la mise à jour de la base de données vectorielle ChromaDB.
+
+    La synchronisation est incrémentale : seuls les documents MongoDB modifiés
+    depuis le dernier passage (`updated_at`) sont relus, et seuls ceux dont
+    l'empreinte du texte formaté et des métadonnées a changé sont ré-encodés. Un passage de
+    réconciliation complet, par lots, supprime les documents disparus.
+    """
+
+    _instance = None
+    _initialized = False
+    _vector_store = None
+    persist_directory = "./chroma_db"
+    collection_name = embedding_collection_name()
+    batch_size = int(os.environ.get("CHROMA_SYNC_BATCH_SIZE", "256"))
+    # Nombre de synchronisations entre deux réconciliations complètes
+    reconcile_every = int(os.environ.get("CHROMA_RECONCILE_EVERY", "12"))
+
+    def __new__(cls, collection, *args, persist_directory=None, read_only=None, **kwargs):
+        """Crée une instance unique de ChromaManager et stocke la collection MongoDB."""
+        if cls._instance is None:
+            cls._instance = super(ChromaManager, cls).__new__(cls)
+            cls._instance.collection = collection
+            cls._instance._sync_count = 0
+            cls._instance._listeners = []
+            cls._instance.version = None
+            cls._instance.read_only = (
+                CHROMA_INDEX_MODE == "snapshot" if read_only is None else read_only
+            )
+            if persist_directory:
+                cls._instance.persist_directory = persist_directory
+        return cls._instance
+
+    def add_listener(self, listener):
+        """Enregistre une fonction `listener(ids, docs)` appelée à chaque modification de l'index.
+
+        `docs` contient les documents MongoDB ré-encodés, ou vaut None pour une suppression.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, ids, docs=None):
+        for listener in self._listeners:
+            try:
+                listener(ids, docs)
+            except Exception as e:
+                logging.error(f"Erreur dans un écouteur de ChromaDB: {e}")
+
+    @property
+    def state_file(self):
+        return os.path.join(
+            self.persist_directory, f"sync_state_{self.collection_name}.json"
+        )
+
+    def _load_state(self):
         try:
-            chroma_ids = set()
-            if self._vector_store:
-                chroma_ids = set(self._vector_store._collection.get()["ids"])
-
-            mongo_docs = await self.collection.find().to_list(length=None)
-            new_docs = [doc for doc in mongo_docs if str(doc["_id"]) not in chroma_ids]
-
-            if new_docs:
-                new_texts = await self.__format_texts(new_docs)
-                if not self._vector_store:
-                    self._vector_store = Chroma.from_texts(
-                        new_texts,
-                        embedding=OpenAIEmbeddings(),
-                        ids=[str(doc["_id"]) for doc in new_docs],
-                        persist_directory=self.persist_directory,
-                    )
-                else:
-                    self._vector_store.add_texts(
-                        new_texts,
-                        ids=[str(doc["_id"]) for doc in new_docs],
-                    )
-                logging.info(
-                    f"Ajout de {len(new_texts)} nouveaux documents à ChromaDB."
+            with open(self.state_file, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, **values):
+        state = self._load_state()
+        state.update(values)
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(state, file, default=str)
+        os.replace(tmp_file, self.state_file)
+
+    @staticmethod
+    def _content_hash(text, metadata):
+        payload = text + json.dumps(metadata, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    async def __format_texts(self, products):
+        """Formate les données des produits en texte pour l'intégration vectorielle."""
+        return [format_product_text(p) for p in products]
+
+    def __open_vector_store(self):
+        if self._vector_store is None:
+            self._vector_store = Chroma(
+                collection_name=self.collection_name,
+                persist_directory=self.persist_directory,
+                embedding_function=get_embeddings(),
+            )
+        return self._vector_store
+
+    async def __upsert_documents(self, docs):
+        """Ré-encode uniquement les documents dont le contenu a changé."""
+        if not docs:
+            return 0
+        texts = await self.__format_texts(docs)
+        ids = [str(doc["_id"]) for doc in docs]
+        metadatas = [product_metadata(doc) for doc in docs]
+        hashes = [
+            self._content_hash(text, metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+
+        # Les appels Chroma/embeddings sont bloquants : hors de la boucle d'événements
+        existing = await asyncio.to_thread(
+            self._vector_store._collection.get, ids=ids, include=["metadatas"]
+        )
+        known = {
+            doc_id: (metadata or {}).get("content_hash")
+            for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+        changed = [i for i, doc_id in enumerate(ids) if known.get(doc_id) != hashes[i]]
+        if changed:
+            await asyncio.to_thread(
+                self._vector_store.add_texts,
+                [texts[i] for i in changed],
+                metadatas=[{**metadatas[i], "content_hash": hashes[i]} for i in changed],
+                ids=[ids[i] for i in changed],
+            )
+            self._notify([ids[i] for i in changed], [docs[i] for i in changed])
+        return len(changed)
+
+    async def __delete_documents(self, ids):
+        if ids:
+            await asyncio.to_thread(self._vector_store.delete, ids=list(ids))
+            self._notify(list(ids))
+        return len(ids)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("Index ChromaDB en lecture seule (mode snapshot).")
+
+    async def sync(self):
+        """Synchronise les documents modifiés depuis le dernier filigrane `updated_at`."""
+        self._check_writable()
+        self.__open_vector_store()
+        watermark = self._load_state().get("watermark")
+        query = {}
+        if watermark:
+            query = {"updated_at": {"$gte": datetime.fromisoformat(watermark)}}
+
+        cursor = (
+            self.collection.find(query)
+            .sort("updated_at", 1)
+            .batch_size(self.batch_size)
+        )
+        batch, upserted, new_watermark = [], 0, watermark
+        async for doc in cursor:
+            batch.append(doc)
+            if doc.get("updated_at"):
+                new_watermark = doc["updated_at"].isoformat()
+            if len(batch) >= self.batch_size:
+                upserted += await self.__upsert_documents(batch)
+                batch = []
+        upserted += await self.__upsert_documents(batch)
+
+        if new_watermark != watermark:
+            self._save_state(watermark=new_watermark)
+        logging.info(f"Synchronisation ChromaDB : {upserted} documents ré-encodés.")
+        return upserted
+
+    async def reconcile(self):
+        """Passage complet par lots : ré-encode les écarts et supprime les documents disparus."""
+        self._check_writable()
+        self.__open_vector_store()
+        upserted = 0
+        batch = []
+        async for doc in self.collection.find().batch_size(self.batch_size):
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                upserted += await self.__upsert_documents(batch)
+                batch = []
+        upserted += await self.__upsert_documents(batch)
+
+        deleted = 0
+        offset = 0
+        while True:
+            page = (
+                await asyncio.to_thread(
+                    self._vector_store._collection.get,
+                    include=[],
+                    limit=self.batch_size,
+                    offset=offset,
+                )
+            )["ids"]
+            if not page:
+                break
+            object_ids = []
+            for doc_id in page:
+                try:
+                    object_ids.append(ObjectId(doc_id))
+                except InvalidId:
+                    continue  # Identifiant étranger à MongoDB : supprimé
+            present = {
+                str(doc["_id"])
+                async for doc in self.collection.find(
+                    {"_id": {"$in": object_ids}}, {"_id": 1}
                 )
-            else:
-                logging.info("Aucun nouveau document trouvé dans MongoDB.")
+            }
+            missing = [doc_id for doc_id in page if doc_id not in present]
+            deleted += await self.__delete_documents(missing)
+            offset += len(page) - len(missing)
 
-        except Exception as e:
+        logging.info(
+            f"Réconciliation ChromaDB : {upserted} ré-encodés, {deleted} supprimés."
+        )
+        return upserted, deleted
+
+    async def watch_changes(self):
+        """Applique en continu les modifications MongoDB via un change stream.
+
+        Nécessite un replica set ; sinon, la synchronisation périodique prend le relais.
+        """
+        self._check_writable()
+        self.__open_vector_store()
+        resume_token = self._load_state().get("resume_token")
+        try:
+            async with self.collection.watch(
+                full_document="updateLookup", resume_after=resume_token
+            ) as stream:
+                while stream.alive:
+                    upserts, deletes = {}, set()
+                    change = await stream.try_next()
+                    while change is not None:
+                        doc_id = str(change["documentKey"]["_id"])
+                        if change["operationType"] == "delete":
+                            upserts.pop(doc_id, None)
+                            deletes.add(doc_id)
+                        elif change.get("fullDocument"):
+                            deletes.discard(doc_id)
+                            upserts[doc_id] = change["fullDocument"]
+                        if len(upserts) + len(deletes) >= self.batch_size:
+                            break
+                        change = await stream.try_next()
+
+                    if upserts or deletes:
+                        await self.__upsert_documents(list(upserts.values()))
+                        await self.__delete_documents(deletes)
+                        self._save_state(resume_token=stream.resume_token)
+                    else:
+                        await asyncio.sleep(1)
+        except OperationFailure as e:
+            logging.warning(f"Change stream MongoDB indisponible : {e}")
+
+    async def reload_snapshot(self, root=CHROMA_SNAPSHOT_ROOT):
+        """Charge en lecture seule la version pointée par CURRENT si elle a changé.
+
+        Le remplacement de l'index est une simple affectation : les requêtes en
+        cours terminent sur l'ancienne version. Retourne True en cas de bascule.
+        """
+        version = current_snapshot(root)
+        if version is None or version == self.version:
+            return False
+        snapshot_dir = os.path.join(root, version)
+        manifest = read_manifest(snapshot_dir)
+        if manifest is None:
+            logging.error(f"Snapshot ChromaDB {version} incomplet, ignoré.")
+            return False
+        if manifest.get("embedding_model") != embedding_model_name():
             logging.error(
-                f"Erreur lors de l'ajout de nouveaux documents à ChromaDB: {e}"
+                f"Snapshot ChromaDB {version} construit avec {manifest.get('embedding_model')}, "
+                f"incompatible avec {embedding_model_name()}."
+            )
+            return False
+
+        # Ouverture de l'index (lecture disque) hors de la boucle d'événements
+        self._vector_store = await asyncio.to_thread(
+            lambda: Chroma(
+                collection_name=manifest["collection_name"],
+                persist_directory=snapshot_dir,
+                embedding_function=get_embeddings(),
             )
+        )
+        self.persist_directory = snapshot_dir
+        self.version = version
+        ChromaManager._initialized = True
+        logging.info(
+            f"Snapshot ChromaDB {version} chargé ({manifest.get('documents')} documents)."
+        )
+        return True
 
     async def initialize(self):
         """Initialise la base de données vectorielle ChromaDB."""
@@ -97,18 +404,20 @@ class ChromaManager:
             logging.info("ChromaDB déjà initialisé.")
             return
 
+        if self.read_only:
+            if not await self.reload_snapshot():
+                logging.warning(
+                    "Aucun snapshot ChromaDB publié : lancez scripts/build_vector_index.py."
+                )
+            return
+
         try:
             if os.path.exists(self.persist_directory) and any(
                 os.scandir(self.persist_directory)
             ):
-                self._vector_store = Chroma(
-                    persist_directory=self.persist_directory,
-                    embedding_function=OpenAIEmbeddings(),
-                )
                 logging.info("ChromaDB chargé depuis le disque.")
-                await self.__add_new_documents()
-            else:
-                await self.__add_new_documents()
+            self.__open_vector_store()
+            await self.sync()
             ChromaManager._initialized = True
 
         except Exception as e:
@@ -122,27 +431,21 @@ class ChromaManager:
         return self._vector_store
 
     async def update_if_needed(self):
-        """Met à jour ChromaDB avec les nouveaux documents de MongoDB."""
+        """Met à jour ChromaDB avec les documents MongoDB modifiés.
+
+        En mode snapshot, bascule sur la dernière version publiée ; retourne
+        True si l'index a été remplacé.
+        """
+        if self.read_only:
+            return await self.reload_snapshot()
+
         if not self._initialized:
-            if os.path.exists(self.persist_directory) and any(
-                os.scandir(self.persist_directory)
-            ):
-                logging.info("ChromaDB non initialisé, rechargement depuis le disque.")
-                self._vector_store = Chroma(
-                    persist_directory=self.persist_directory,
-                    embedding_function=OpenAIEmbeddings(),
-                )
-                await self.__add_new_documents()
-                ChromaManager._initialized = True
-                return
-            else:
-                logging.info("ChromaDB non initialisé, initialisation depuis MongoDB.")
-                await self.initialize()
-                return
-
-        mongo_count = await self.collection.count_documents({})
-        chroma_count = self._vector_store._collection.count()
-        if mongo_count != chroma_count:
-            await self.__add_new_documents()
+            logging.info("ChromaDB non initialisé, initialisation depuis MongoDB.")
+            await self.initialize()
+            return
+
+        self._sync_count += 1
+        if self.reconcile_every and self._sync_count % self.reconcile_every == 0:
+            await self.reconcile()
         else:
-            logging.info("ChromaDB est à jour.")
+            await self.sync()
@@ -0,0 +1,151 @@
+from typing import List, Optional, Tuple
+import logging
+import os
+
+import tiktoken
+
+# Configuration des logs
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+# Nombre maximal de tokens consacrés aux produits dans le prompt
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2000"))
+# Longueur maximale (caractères) d'un champ texte avant troncature
+CONTEXT_FIELD_MAX_CHARS = int(os.environ.get("CONTEXT_FIELD_MAX_CHARS", "300"))
+# En dessous de ce reliquat, un produit n'est pas tronqué mais écarté
+CONTEXT_MIN_DOC_TOKENS = int(os.environ.get("CONTEXT_MIN_DOC_TOKENS", "40"))
+
+EMPTY_VALUES = ("", "Non disponible.", "None", "null")
+
+
+class ContextBuilder:
+    """Construit le contexte du prompt RAG sous un budget de tokens.
+
+    Les champs vides sont omis, les champs longs tronqués et les tableaux
+    de caractéristiques compactés en `clé: valeur`. Le budget est réparti
+    entre les produits par ordre de pertinence : la part non utilisée par
+    un produit court revient aux suivants.
+    """
+
+    # Champs d'identification en tête : conservés en cas de troncature
+    fields = [
+        ("name", "Nom"),
+        ("_id", "_id"),
+        ("source", "source"),
+        ("product_id", "product_id"),
+        ("price", "Prix"),
+        ("condition", "Condition"),
+        ("stock", "En stock"),
+        ("brand", "Marque"),
+        ("categories", "Catégories"),
+        ("sizes", "Tailles"),
+        ("colors", "Couleurs"),
+        ("description", "Description"),
+        ("feature_table", "Caractéristiques"),
+        ("feature_bullet", "Points clés"),
+    ]
+    projection = {field: 1 for field, _ in fields}
+
+    def __init__(
+        self,
+        model: str = "gpt-4",
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        max_field_chars: int = CONTEXT_FIELD_MAX_CHARS,
+        min_doc_tokens: int = CONTEXT_MIN_DOC_TOKENS,
+    ):
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.budget = budget
+        self.max_field_chars = max_field_chars
+        self.min_doc_tokens = min_doc_tokens
+        self.stats = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "max_prompt_tokens": 0,
+            "context_tokens": 0,
+            "truncated_docs": 0,
+            "dropped_docs": 0,
+        }
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def _truncate_text(self, text: str) -> str:
+        text = " ".join(text.split())
+        if len(text) > self.max_field_chars:
+            text = text[: self.max_field_chars].rsplit(" ", 1)[0] + "…"
+        return text
+
+    def compact_value(self, value) -> Optional[str]:
+        """Représentation courte d'un champ, ou None s'il est vide."""
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return "oui" if value else "non"
+        if isinstance(value, dict):
+            items = [
+                f"{key}: {compact}"
+                for key, item in value.items()
+                if (compact := self.compact_value(item)) is not None
+            ]
+            return self._truncate_text("; ".join(items)) if items else None
+        if isinstance(value, (list, tuple)):
+            items = []
+            for item in value:
+                compact = self.compact_value(item)
+                if compact is not None and compact not in items:
+                    items.append(compact)
+            return self._truncate_text(", ".join(items)) if items else None
+        text = str(value).strip()
+        if text in EMPTY_VALUES:
+            return None
+        return self._truncate_text(text)
+
+    def format_product(self, product) -> str:
+        lines = []
+        for field, label in self.fields:
+            value = self.compact_value(product.get(field))
+            if value is not None:
+                lines.append(f"- {label}: {value}")
+        return "\n".join(lines)
+
+    def _truncate_tokens(self, text: str, max_tokens: int) -> str:
+        return self.encoding.decode(self.encoding.encode(text)[:max_tokens]) + "…"
+
+    def build(self, products: List[dict]) -> Tuple[str, int]:
+        """Retourne le contexte et son nombre de tokens ; `products` est trié par pertinence."""
+        blocks, used = [], 0
+        for i, product in enumerate(products):
+            remaining_budget = self.budget - used
+            share = remaining_budget // (len(products) - i)
+            text = self.format_product(product)
+            tokens = self.count_tokens(text)
+            if tokens > share:
+                if share < self.min_doc_tokens:
+                    self.stats["dropped_docs"] += 1
+                    continue
+                text = self._truncate_tokens(text, share)
+                tokens = self.count_tokens(text)
+                self.stats["truncated_docs"] += 1
+            blocks.append(text)
+            used += tokens + 2  # Séparateur entre produits
+        return "\n\n".join(blocks), used
+
+    def record(self, prompt_tokens: int, context_tokens: int):
+        """Enregistre les statistiques de tokens d'une requête."""
+        self.stats["requests"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["context_tokens"] += context_tokens
+        self.stats["max_prompt_tokens"] = max(self.stats["max_prompt_tokens"], prompt_tokens)
+        logging.info(
+            f"Prompt RAG : {prompt_tokens} tokens (contexte {context_tokens}/{self.budget})."
+        )
+
+    def get_stats(self) -> dict:
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "budget": self.budget,
+            "avg_prompt_tokens": self.stats["prompt_tokens"] / requests if requests else 0.0,
+        }
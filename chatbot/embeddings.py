@@ -0,0 +1,228 @@
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from typing import List
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# Configuration des logs
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+# "openai" (API distante) ou "local" (sentence-transformers sur CPU)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-ada-002")
+LOCAL_EMBEDDING_MODEL = os.environ.get(
+    "LOCAL_EMBEDDING_MODEL",
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+)
+# Moteur d'exécution du modèle local : "torch" ou "onnx"
+LOCAL_EMBEDDING_RUNTIME = os.environ.get("LOCAL_EMBEDDING_RUNTIME", "torch")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "128"))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH", "./embedding_cache/embeddings.sqlite"
+)
+
+
+class EmbeddingCache:
+    """Cache disque (SQLite) des vecteurs, indexé par empreinte (modèle, texte)."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(model_name: str, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]):
+        found = {}
+        with self._lock:
+            # SQLite limite le nombre de paramètres par requête
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+
+class LocalEmbeddings(Embeddings):
+    """Modèle sentence-transformers exécuté localement sur CPU, par lots."""
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBEDDING_MODEL,
+        runtime: str = LOCAL_EMBEDDING_RUNTIME,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "Le backend d'embeddings local nécessite `sentence-transformers` "
+                "(et `optimum[onnxruntime]` pour LOCAL_EMBEDDING_RUNTIME=onnx)."
+            ) from e
+
+        self.model = SentenceTransformer(model_name, device="cpu", backend=runtime)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Encode par lots, en parallèle, avec reprise exponentielle et cache disque.
+
+    Seuls les textes absents du cache sont envoyés au modèle sous-jacent ;
+    les textes identiques d'un même appel ne sont encodés qu'une fois.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache: EmbeddingCache = None,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        backoff_base: float = 1.0,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache()
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.stats = {"cache_hits": 0, "embedded": 0, "retries": 0}
+
+    def _with_retry(self, fn, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_base * (2**attempt) * (1 + random.random())
+                self.stats["retries"] += 1
+                logging.warning(
+                    f"Échec de l'encodage ({e}), nouvel essai dans {delay:.1f}s."
+                )
+                time.sleep(delay)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self._with_retry(self.embeddings.embed_documents, texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.key(self.model_name, "document", text) for text in texts]
+        vectors = self.cache.get_many(list(set(keys)))
+        self.stats["cache_hits"] += sum(1 for key in keys if key in vectors)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            missing_keys = list(missing)
+            batches = [
+                missing_keys[i : i + self.batch_size]
+                for i in range(0, len(missing_keys), self.batch_size)
+            ]
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                results = executor.map(
+                    lambda batch: self._embed_batch([missing[key] for key in batch]),
+                    batches,
+                )
+                for batch, batch_vectors in zip(batches, results):
+                    new_items = list(zip(batch, batch_vectors))
+                    self.cache.set_many(new_items)
+                    vectors.update(new_items)
+            self.stats["embedded"] += len(missing)
+            logging.info(
+                f"{len(missing)} textes encodés, {len(texts) - len(missing)} servis par le cache."
+            )
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache.key(self.model_name, "query", text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            self.stats["cache_hits"] += 1
+            return cached[key]
+        vector = self._with_retry(self.embeddings.embed_query, text)
+        self.cache.set_many([(key, vector)])
+        self.stats["embedded"] += 1
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+def embedding_model_name(backend: str = EMBEDDING_BACKEND) -> str:
+    return LOCAL_EMBEDDING_MODEL if backend == "local" else EMBEDDING_MODEL
+
+
+def collection_name(backend: str = EMBEDDING_BACKEND) -> str:
+    """Nom de collection Chroma : un index par modèle, les dimensions différant."""
+    if backend == "openai" and EMBEDDING_MODEL == "text-embedding-ada-002":
+        return "langchain"  # Collection historique
+    slug = "".join(c if c.isalnum() else "_" for c in embedding_model_name(backend))
+    return f"products_{slug}"[:63]
+
+
+def get_base_embeddings(backend: str = EMBEDDING_BACKEND) -> Embeddings:
+    """Retourne le modèle d'embeddings brut du backend demandé, sans cache."""
+    if backend == "openai":
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL, chunk_size=EMBEDDING_BATCH_SIZE)
+    if backend == "local":
+        return LocalEmbeddings()
+    raise ValueError(f"Backend d'embeddings inconnu : {backend}")
+
+
+def get_embeddings(backend: str = EMBEDDING_BACKEND) -> CachedEmbeddings:
+    """Retourne le modèle d'embeddings configuré, avec lots et cache disque."""
+    return CachedEmbeddings(
+        get_base_embeddings(backend),
+        embedding_model_name(backend),
+        # Un modèle local n'a ni limite de débit ni intérêt à paralléliser les lots
+        max_concurrency=1 if backend == "local" else EMBEDDING_MAX_CONCURRENCY,
+    )
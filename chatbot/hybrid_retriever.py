@@ -0,0 +1,208 @@
+from collections import defaultdict
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import math
+import os
+
+from langchain_core.documents import Document
+
+from .answer_cache import AnswerCache
+from .query_filters import matches_filter
+
+# Configuration des logs
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+RETRIEVER_K = int(os.environ.get("RETRIEVER_K", "5"))
+# Nombre de candidats récupérés par chaque méthode avant la fusion
+RETRIEVER_FETCH_K = int(os.environ.get("RETRIEVER_FETCH_K", "20"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+# Modèle cross-encoder de reclassement (vide = désactivé)
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "")
+
+STOPWORDS = {
+    "le", "la", "les", "un", "une", "des", "de", "du", "d", "l", "et", "ou",
+    "en", "au", "aux", "pour", "avec", "sans", "sur", "par", "a", "je", "tu",
+    "il", "elle", "on", "nous", "vous", "ils", "cherche", "veux", "voudrais",
+    "est", "ce", "cet", "cette", "ces", "mon", "ma", "mes", "qui", "que",
+    "quoi", "quel", "quelle", "avez", "y", "moi", "the", "of", "and",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token
+        for token in AnswerCache.normalize(text or "").split()
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+class KeywordIndex:
+    """Index inversé BM25 en mémoire sur le nom, la marque et les catégories."""
+
+    fields = {"name": 1, "brand": 1, "categories": 1}
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_tokens: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.names: Dict[str, str] = {}  # nom normalisé -> id
+        self.doc_names: Dict[str, str] = {}  # id -> nom normalisé
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @staticmethod
+    def _document_text(doc) -> str:
+        categories = doc.get("categories") or []
+        return " ".join(
+            [doc.get("name") or "", doc.get("brand") or ""]
+            + [c for c in categories if c]
+        )
+
+    def remove(self, doc_id: str):
+        tokens = self.doc_tokens.pop(doc_id, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            self.postings[token].pop(doc_id, None)
+            if not self.postings[token]:
+                del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        name = self.doc_names.pop(doc_id, None)
+        if name is not None and self.names.get(name) == doc_id:
+            del self.names[name]
+
+    def add(self, doc):
+        doc_id = str(doc["_id"])
+        self.remove(doc_id)
+        counts: Dict[str, int] = defaultdict(int)
+        for token in tokenize(self._document_text(doc)):
+            counts[token] += 1
+        for token, count in counts.items():
+            self.postings[token][doc_id] = count
+        self.doc_tokens[doc_id] = dict(counts)
+        self.doc_lengths[doc_id] = sum(counts.values())
+        self.total_length += self.doc_lengths[doc_id]
+        if doc.get("name"):
+            name = AnswerCache.normalize(doc["name"])
+            self.names[name] = doc_id
+            self.doc_names[doc_id] = name
+
+    async def build(self, collection, batch_size: int = 1000):
+        """Construit l'index en parcourant la collection MongoDB par lots."""
+        async for doc in collection.find({}, self.fields).batch_size(batch_size):
+            self.add(doc)
+        logging.info(f"Index BM25 construit : {len(self)} produits.")
+
+    def on_index_change(self, ids, docs=None):
+        """Écouteur de ChromaManager : met à jour ou retire les produits concernés."""
+        if docs is None:
+            for doc_id in ids:
+                self.remove(doc_id)
+        else:
+            for doc in docs:
+                self.add(doc)
+
+    def exact(self, query: str) -> Optional[str]:
+        """Id du produit dont le nom correspond exactement à la requête."""
+        return self.names.get(AnswerCache.normalize(query))
+
+    def search(self, query: str, k: int = RETRIEVER_FETCH_K) -> List[tuple]:
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs
+        scores: Dict[str, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class HybridRetriever:
+    """Fusionne BM25 et recherche vectorielle (reciprocal rank fusion), avec reclassement optionnel."""
+
+    def __init__(
+        self,
+        vector_store,
+        keyword_index: KeywordIndex,
+        k: int = RETRIEVER_K,
+        fetch_k: int = RETRIEVER_FETCH_K,
+        rrf_k: int = RRF_K,
+        rerank_model: str = RERANK_MODEL,
+    ):
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self.reranker = None
+        if rerank_model:
+            try:
+                from sentence_transformers import CrossEncoder
+
+                self.reranker = CrossEncoder(rerank_model, device="cpu")
+            except ImportError:
+                logging.warning(
+                    "`sentence-transformers` absent : reclassement désactivé."
+                )
+
+    def _get_documents(self, ids: List[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        result = self.vector_store._collection.get(
+            ids=ids, include=["documents", "metadatas"]
+        )
+        return {
+            doc_id: Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        }
+
+    def _fuse(self, rankings: List[List[str]]) -> List[str]:
+        scores: Dict[str, float] = defaultdict(float)
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking):
+                scores[doc_id] += 1.0 / (self.rrf_k + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def _rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        scores = self.reranker.predict([(query, doc.page_content) for doc in docs])
+        ranked = sorted(zip(scores, range(len(docs))), reverse=True)
+        return [docs[i] for _, i in ranked]
+
+    async def ainvoke(self, query: str, where: Optional[dict] = None) -> List[Document]:
+        """Recherche hybride ; `where` pré-filtre les candidats sur leurs métadonnées."""
+        keyword_hits = [doc_id for doc_id, _ in self.keyword_index.search(query, self.fetch_k)]
+        vector_docs = await self.vector_store.asimilarity_search(
+            query, k=self.fetch_k, filter=where
+        )
+        documents = {doc.id: doc for doc in vector_docs}
+        if where:
+            # L'index BM25 ne connaît pas les métadonnées : filtrage des candidats
+            documents.update(await asyncio.to_thread(self._get_documents, keyword_hits))
+            keyword_hits = [
+                doc_id
+                for doc_id in keyword_hits
+                if doc_id in documents and matches_filter(documents[doc_id].metadata, where)
+            ]
+
+        fused = self._fuse([keyword_hits, [doc.id for doc in vector_docs]])
+        candidates = fused[: self.fetch_k if self.reranker else self.k]
+        missing = [doc_id for doc_id in candidates if doc_id not in documents]
+        documents.update(await asyncio.to_thread(self._get_documents, missing))
+        docs = [documents[doc_id] for doc_id in candidates if doc_id in documents]
+
+        if self.reranker and docs:
+            docs = await asyncio.to_thread(self._rerank, query, docs)
+        return docs[: self.k]
@@ -0,0 +1,121 @@
+from typing import Optional, Tuple
+import re
+
+from api.scrapers.normalization import CONDITION_VERY_GOOD, parse_price
+
+# Sources connues, telles que stockées dans le champ `source` des produits
+SOURCES = ("vinted", "amazon")
+
+# Nombre suivi d'une devise facultative (groupes : montant, devise). Un nombre
+# suivi d'une unité ("3 ans", "sous 3 jours", "128 go") n'est jamais un prix.
+_UNITS = r"ans?|jours?|semaines?|mois|heures?|h|min|cm|mm|m|kg|g|go|gb|to|tb|mo|ml|l|pouces?|%|pi[èe]ces?|places?"
+_NUMBER = rf"(\d+(?:[.,]\d+)?)(?![\d.,])(?!\s*(?:{_UNITS})\b)\s*(€|euros?\b|eur\b)?"
+# Sans devise, un nombre n'est un prix que si la question parle de prix
+_PRICE_WORD = re.compile(r"\b(?:prix|budget|co[uû]te?s?|co[uû]tant|tarifs?)\b", re.IGNORECASE)
+
+_PRICE_BETWEEN = re.compile(rf"\bentre\s+{_NUMBER}\s+et\s+{_NUMBER}", re.IGNORECASE)
+_PRICE_MAX = re.compile(
+    rf"(?:\bmoins\s+de|\bsous|\bmax(?:imum)?|\bjusqu'?\s*[àa]|\binf[ée]rieur\s+[àa]|\bpas\s+plus\s+de|<=?)\s*{_NUMBER}",
+    re.IGNORECASE,
+)
+_PRICE_MIN = re.compile(
+    rf"(?:\bplus\s+de|\bau\s+moins|\bmin(?:imum)?|\b[àa]\s+partir\s+de|\bsup[ée]rieur\s+[àa]|>=?)\s*{_NUMBER}",
+    re.IGNORECASE,
+)
+_SECOND_HAND = re.compile(
+    r"\b(?:seconde?\s+main|d'?\s*occasion|occasion|usag[ée]e?s?|reconditionn[ée]e?s?)\b",
+    re.IGNORECASE,
+)
+# Testé avant _NEW : "comme neuf" désigne de la seconde main en très bon état
+_LIKE_NEW = re.compile(
+    r"\b(?:comme\s+neu(?:f|ve|fs|ves)|like\s+new|tr[èe]s\s+bon\s+[ée]tat)\b",
+    re.IGNORECASE,
+)
+_NEW = re.compile(r"\bneu(?:f|ve|fs|ves)\b", re.IGNORECASE)
+_IN_STOCK = re.compile(r"\b(?:en\s+stock|disponibles?)\b", re.IGNORECASE)
+_SOURCE = re.compile(
+    rf"\b(?:sur\s+|chez\s+|de\s+)?({'|'.join(SOURCES)})\b", re.IGNORECASE
+)
+
+
+def _is_price(match, currency_groups, query: str) -> bool:
+    return _PRICE_WORD.search(query) is not None or any(
+        match.group(group) for group in currency_groups
+    )
+
+
+def _find_price(pattern, text: str, currency_groups, query: str):
+    for match in pattern.finditer(text):
+        if _is_price(match, currency_groups, query):
+            return match
+    return None
+
+
+def parse_query_filters(query: str) -> Tuple[Optional[dict], str]:
+    """Traduit les contraintes exprimées dans la question en filtre `where` Chroma.
+
+    Retourne le filtre (None s'il n'y a aucune contrainte) et la question
+    débarrassée des expressions reconnues, pour la recherche textuelle.
+    """
+    conditions = []
+    text = query
+
+    match = _find_price(_PRICE_BETWEEN, text, (2, 4), query)
+    if match:
+        low, high = sorted([parse_price(match.group(1)), parse_price(match.group(3))])
+        conditions += [{"price": {"$gte": low}}, {"price": {"$lte": high}}]
+        text = text[: match.start()] + text[match.end() :]
+    else:
+        for pattern, operator in ((_PRICE_MAX, "$lte"), (_PRICE_MIN, "$gte")):
+            match = _find_price(pattern, text, (2,), query)
+            if match:
+                conditions.append({"price": {operator: parse_price(match.group(1))}})
+                text = text[: match.start()] + text[match.end() :]
+
+    if _LIKE_NEW.search(text):
+        conditions.append({"condition": CONDITION_VERY_GOOD})
+        text = _LIKE_NEW.sub(" ", text)
+
+    if _SECOND_HAND.search(text):
+        conditions.append({"second_hand": True})
+        text = _SECOND_HAND.sub(" ", text)
+    elif _NEW.search(text):
+        conditions.append({"second_hand": False})
+        text = _NEW.sub(" ", text)
+
+    if _IN_STOCK.search(text):
+        conditions.append({"stock": True})
+        text = _IN_STOCK.sub(" ", text)
+
+    sources = {m.group(1).lower() for m in _SOURCE.finditer(text)}
+    if len(sources) == 1:
+        conditions.append({"source": sources.pop()})
+        text = _SOURCE.sub(" ", text)
+
+    text = " ".join(text.split()) or query
+    if not conditions:
+        return None, query
+    if len(conditions) == 1:
+        return conditions[0], text
+    return {"$and": conditions}, text
+
+
+def matches_filter(metadata: dict, where: Optional[dict]) -> bool:
+    """Évalue localement un filtre `where` (sous-ensemble utilisé ci-dessus)."""
+    if not where:
+        return True
+    if "$and" in where:
+        return all(matches_filter(metadata, clause) for clause in where["$and"])
+    for key, expected in where.items():
+        if key not in metadata:
+            return False
+        value = metadata[key]
+        if isinstance(expected, dict):
+            for operator, bound in expected.items():
+                if operator == "$lte" and not value <= bound:
+                    return False
+                if operator == "$gte" and not value >= bound:
+                    return False
+        elif value != expected:
+            return False
+    return True
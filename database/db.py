@@ -1,5 +1,7 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -10,9 +12,62 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def async_url_and_connect_args(url):
+    """URL asyncpg dérivée de POSTGRES_URI et arguments de connexion associés.
+
+    asyncpg refuse les paramètres propres à libpq (`sslmode`, `connect_timeout`...) :
+    ils sont traduits en arguments de connexion asyncpg. Les autres paramètres
+    libpq n'ont pas d'équivalent ; POSTGRES_ASYNC_URI doit alors être renseigné.
+    """
+    url = make_url(url).set(drivername="postgresql+asyncpg")
+    query = {
+        key: value if isinstance(value, str) else value[-1]
+        for key, value in url.query.items()
+    }
+    connect_args = {}
+    if "sslmode" in query:
+        # disable, allow, prefer, require, verify-ca, verify-full : acceptés tels quels
+        connect_args["ssl"] = query.pop("sslmode")
+    if "connect_timeout" in query:
+        connect_args["timeout"] = float(query.pop("connect_timeout"))
+    if "application_name" in query:
+        connect_args["server_settings"] = {"application_name": query.pop("application_name")}
+    if query:
+        raise ValueError(
+            "Paramètres de POSTGRES_URI non pris en charge par asyncpg : "
+            f"{', '.join(sorted(query))}. Renseignez POSTGRES_ASYNC_URI."
+        )
+    return url.set(query={}), connect_args
+
+
+# Moteur asynchrone (asyncpg) pour les endpoints qui ne doivent pas bloquer la boucle
+if os.environ.get("POSTGRES_ASYNC_URI"):
+    ASYNC_DATABASE_URL, ASYNC_CONNECT_ARGS = os.environ["POSTGRES_ASYNC_URI"], {}
+else:
+    ASYNC_DATABASE_URL, ASYNC_CONNECT_ARGS = async_url_and_connect_args(DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=ASYNC_CONNECT_ARGS,
+    pool_size=int(os.environ.get("POSTGRES_POOL_SIZE", "10")),
+    max_overflow=int(os.environ.get("POSTGRES_MAX_OVERFLOW", "10")),
+    pool_timeout=float(os.environ.get("POSTGRES_POOL_TIMEOUT", "10")),
+    pool_recycle=int(os.environ.get("POSTGRES_POOL_RECYCLE", "1800")),
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
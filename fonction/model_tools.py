@@ -1,9 +1,11 @@
 import torch
 from torchvision import models
+from models.runtime_config import apply_torch_config
 
 # Charger le modèle EfficientNet
 MODEL_PATH = "models/saved/efficientnet_b3.pth"
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+apply_torch_config()
 
 # Initialiser et charger le modèle EfficientNet
 model = models.efficientnet_b3(weights=None)
@@ -1,22 +1,163 @@
-from insightface.app import FaceAnalysis
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
 import cv2
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
+from models.runtime_config import OrtRuntimeConfig, apply_ort_config
+
+# Seuls les modules utiles sont chargés (pas de landmarks 2D/3D ni genre/âge)
+ALLOWED_MODULES = ["detection", "recognition"]
+
+# ctx_id=0 pour GPU, -1 pour CPU
+ARCFACE_CTX_ID = int(os.environ.get("ARCFACE_CTX_ID", "0"))
+
+# Taille d'entrée du détecteur selon le type de requête
+DET_SIZES: Dict[str, Tuple[int, int]] = {
+    "capture": (640, 640),
+    "recognize": (640, 640),
+    "stream": (320, 320),
+}
+for _request_type in DET_SIZES:
+    _env_size = os.environ.get(f"ARCFACE_DET_SIZE_{_request_type.upper()}")
+    if _env_size:
+        DET_SIZES[_request_type] = (int(_env_size), int(_env_size))
+
+# Côté max de l'image passée au détecteur (0 = pas de réduction préalable)
+DET_MAX_SIDE = int(os.environ.get("ARCFACE_DET_MAX_SIDE", "0"))
+
+# Nombre max de visages alignés envoyés en un seul appel ONNX de reconnaissance
+REC_BATCH_SIZE = int(os.environ.get("ARCFACE_REC_BATCH_SIZE", "32"))
 
 
 class ArcFaceModel:
-    def __init__(self):
+    def __init__(
+        self,
+        model_name: str = "buffalo_l",
+        ctx_id: int = ARCFACE_CTX_ID,
+        allowed_modules: Optional[List[str]] = None,
+        det_thresh: float = 0.5,
+        det_max_side: int = DET_MAX_SIDE,
+        ort_config: Optional[OrtRuntimeConfig] = None,
+    ):
         print("✅ Chargement du modèle Buffalo_L...")
-        self.app = FaceAnalysis(name="buffalo_l")
+        self.app = FaceAnalysis(
+            name=model_name, allowed_modules=allowed_modules or ALLOWED_MODULES
+        )
         self.app.prepare(
-            ctx_id=0, det_size=(640, 640)
-        )  # ctx_id=0 pour GPU, -1 pour CPU
+            ctx_id=ctx_id, det_thresh=det_thresh, det_size=DET_SIZES["capture"]
+        )
+        apply_ort_config(self.app, ort_config)
+        self.det_model = self.app.det_model
+        self.rec_model = self.app.models["recognition"]
+        self.det_max_side = det_max_side
+
+    def _downscale(self, img, max_side: int):
+        """Réduit l'image pour la détection et retourne le facteur appliqué."""
+        height, width = img.shape[:2]
+        if not max_side or max(height, width) <= max_side:
+            return img, 1.0
+        scale = max_side / float(max(height, width))
+        small = cv2.resize(
+            img,
+            (int(round(width * scale)), int(round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+        return small, scale
+
+    def detect(
+        self,
+        img,
+        request_type: str = "recognize",
+        max_num: int = 0,
+        det_max_side: Optional[int] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[Face]:
+        """Détecte les visages, éventuellement sur une image réduite.
+
+        Les boîtes et les points clés sont ramenés à la résolution d'origine,
+        l'alignement se fait donc toujours sur l'image pleine résolution.
+        """
+        start = time.perf_counter()
+        max_side = self.det_max_side if det_max_side is None else det_max_side
+        small, scale = self._downscale(img, max_side)
+        if timings is not None:
+            timings["downscale"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bboxes, kpss = self.det_model.detect(
+            small, input_size=DET_SIZES.get(request_type), max_num=max_num
+        )
+        if timings is not None:
+            timings["detect"] = time.perf_counter() - start
+
+        faces = []
+        for i in range(bboxes.shape[0]):
+            kps = kpss[i] / scale if kpss is not None else None
+            faces.append(
+                Face(bbox=bboxes[i, 0:4] / scale, kps=kps, det_score=bboxes[i, 4])
+            )
+        return faces
+
+    def extract(
+        self, img, faces: List[Face], timings: Optional[Dict[str, float]] = None
+    ) -> List[Face]:
+        """Aligne chaque visage sur l'image pleine résolution et calcule son embedding."""
+        start = time.perf_counter()
+        for face in faces:
+            self.rec_model.get(img, face)
+        if timings is not None:
+            timings["embed"] = time.perf_counter() - start
+        return faces
+
+    def extract_batch(
+        self,
+        images,
+        faces_per_image: List[List[Face]],
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[List[Face]]:
+        """Calcule les embeddings de tous les visages de plusieurs images en lots ONNX."""
+        start = time.perf_counter()
+        image_size = self.rec_model.input_size[0]
+        flat_faces, crops = [], []
+        for img, faces in zip(images, faces_per_image):
+            for face in faces:
+                crops.append(
+                    face_align.norm_crop(img, landmark=face.kps, image_size=image_size)
+                )
+                flat_faces.append(face)
+        if timings is not None:
+            timings["align"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, len(crops), REC_BATCH_SIZE):
+            features = self.rec_model.get_feat(crops[i : i + REC_BATCH_SIZE])
+            for face, feature in zip(flat_faces[i : i + REC_BATCH_SIZE], features):
+                face.embedding = feature.flatten()
+        if timings is not None:
+            timings["embed"] = time.perf_counter() - start
+        return faces_per_image
+
+    def get_faces(
+        self,
+        img,
+        request_type: str = "recognize",
+        max_num: int = 0,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[Face]:
+        """Détection puis reconnaissance, en deux étapes."""
+        faces = self.detect(img, request_type, max_num=max_num, timings=timings)
+        return self.extract(img, faces, timings=timings)
 
-    def get_embedding(self, image_path):
+    def get_embedding(self, image_path, request_type: str = "capture"):
         img = cv2.imread(image_path)
         if img is None:
             print(f"❌ Erreur : Impossible de charger l'image {image_path}")
             return None
 
-        faces = self.app.get(img)  # Détection et extraction des visages
+        faces = self.get_faces(img, request_type)  # Détection et extraction des visages
         if len(faces) == 0:
             print(f"❌ Aucun visage détecté dans {image_path}")
             return None
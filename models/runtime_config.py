@@ -0,0 +1,110 @@
+import os
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+import onnxruntime as ort
+
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class OrtRuntimeConfig:
+    """Options des sessions ONNX Runtime (0 thread = valeur par défaut d'ORT)."""
+
+    intra_op_threads: int = field(
+        default_factory=lambda: int(os.environ.get("ORT_INTRA_OP_THREADS", "0"))
+    )
+    inter_op_threads: int = field(
+        default_factory=lambda: int(os.environ.get("ORT_INTER_OP_THREADS", "0"))
+    )
+    graph_optimization: str = field(
+        default_factory=lambda: os.environ.get("ORT_GRAPH_OPTIMIZATION", "all")
+    )
+    execution_mode: str = field(
+        default_factory=lambda: os.environ.get("ORT_EXECUTION_MODE", "sequential")
+    )
+    enable_mem_arena: bool = field(
+        default_factory=lambda: _env_bool("ORT_ENABLE_MEM_ARENA", True)
+    )
+    enable_mem_pattern: bool = field(
+        default_factory=lambda: _env_bool("ORT_ENABLE_MEM_PATTERN", True)
+    )
+
+    def session_options(self) -> ort.SessionOptions:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+            self.graph_optimization
+        ]
+        options.execution_mode = EXECUTION_MODES[self.execution_mode]
+        options.enable_cpu_mem_arena = self.enable_mem_arena
+        options.enable_mem_pattern = self.enable_mem_pattern
+        return options
+
+
+@dataclass
+class TorchRuntimeConfig:
+    """Taille des pools de threads PyTorch (0 = valeur par défaut de PyTorch)."""
+
+    num_threads: int = field(
+        default_factory=lambda: int(os.environ.get("TORCH_NUM_THREADS", "0"))
+    )
+    interop_threads: int = field(
+        default_factory=lambda: int(os.environ.get("TORCH_INTEROP_THREADS", "0"))
+    )
+
+
+def apply_ort_config(face_app, config: Optional[OrtRuntimeConfig] = None):
+    """Recrée les sessions ONNX des modèles insightface avec les options voulues.
+
+    `FaceAnalysis` ne transmet pas de `SessionOptions` à ONNX Runtime ; on
+    reconstruit donc chaque session sur le même fichier et les mêmes providers.
+    """
+    config = config or OrtRuntimeConfig()
+    options = config.session_options()
+    for taskname, model in face_app.models.items():
+        providers = model.session.get_providers()
+        model.session = ort.InferenceSession(
+            model.model_file, sess_options=options, providers=providers
+        )
+        logging.info(
+            f"Session ONNX {taskname} : intra={config.intra_op_threads} "
+            f"inter={config.inter_op_threads} mode={config.execution_mode}"
+        )
+
+
+def apply_torch_config(config: Optional[TorchRuntimeConfig] = None):
+    """Applique la configuration des threads PyTorch au processus."""
+    import torch
+
+    config = config or TorchRuntimeConfig()
+    if config.num_threads > 0:
+        torch.set_num_threads(config.num_threads)
+    if config.interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(config.interop_threads)
+        except RuntimeError as e:
+            # Ne peut être modifié qu'avant le premier calcul parallèle
+            logging.warning(f"Threads inter-op PyTorch non modifiés : {e}")
+    logging.info(f"PyTorch : {torch.get_num_threads()} threads intra-op")
@@ -0,0 +1,67 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import api  # Charge .env et remplace sqlite3 par pysqlite3
+import argparse
+import asyncio
+from api.bd_scraping_arbook.database import DatabaseManager
+from api.bd_scraping_arbook.indexes import (
+    PRODUCT_COLLECTION,
+    QUERY_PLANS,
+    ensure_indexes,
+    explain,
+)
+
+# Audit des plans d'exécution : lance `explain` sur la requête type de chaque
+# méthode de `Query` et signale les parcours complets de collection (COLLSCAN).
+# Code de sortie 1 si une requête censée être indexée ne l'est pas.
+# Exemple : python scripts/audit_indexes.py --create
+
+
+async def audit(create):
+    db_manager = DatabaseManager()
+    if not await db_manager.initialize():
+        print("❌ Impossible de se connecter à MongoDB")
+        sys.exit(1)
+    database = db_manager.get_client()[db_manager.database_name]
+
+    if create:
+        created = await ensure_indexes(database[PRODUCT_COLLECTION])
+        print(f"🛠️  Index vérifiés : {', '.join(created)}")
+
+    failures = 0
+    for method, plan in QUERY_PLANS.items():
+        result = await explain(database, PRODUCT_COLLECTION, plan)
+        if not result["collscan"]:
+            status = "✅"
+        elif plan.get("collscan_expected"):
+            status = "⚠️ "
+        else:
+            status = "❌"
+            failures += 1
+        print(
+            f"{status} {method:<42} {' > '.join(result['stages']):<30} "
+            f"retournés={result['returned']} clés={result['keys_examined']} "
+            f"docs={result['docs_examined']} {result['time_ms']}ms"
+        )
+
+    if failures:
+        print(f"❌ {failures} requête(s) sans index")
+        sys.exit(1)
+    print("✅ Toutes les requêtes attendues sont indexées")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit des index de Product_scraping")
+    parser.add_argument(
+        "--create", action="store_true", help="Crée les index manquants avant l'audit"
+    )
+    args = parser.parse_args()
+    asyncio.run(audit(args.create))
+
+
+if __name__ == "__main__":
+    main()
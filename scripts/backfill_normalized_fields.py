@@ -0,0 +1,77 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import api  # Charge .env et remplace sqlite3 par pysqlite3
+import argparse
+import asyncio
+import time
+from pymongo import UpdateOne
+from api.bd_scraping_arbook.cache import bump_catalog_version
+from api.bd_scraping_arbook.database import DatabaseManager
+from api.bd_scraping_arbook.indexes import PRODUCT_COLLECTION
+from api.scrapers.normalization import normalize_product
+
+# Calcule les champs normalisés (price_cents, currency, rating_value, uploaded_at,
+# condition_normalized...) des produits déjà en base, par lots de bulk_write.
+# `updated_at` n'est pas modifié : le texte indexé dans ChromaDB reste identique.
+# Exemple : python scripts/backfill_normalized_fields.py --only-missing
+
+RAW_FIELDS = {
+    "source": 1,
+    "price": 1,
+    "delivery_price": 1,
+    "price_with_protection": 1,
+    "rating": 1,
+    "uploaded": 1,
+    "condition": 1,
+}
+
+
+async def backfill(batch_size, only_missing, dry_run):
+    db_manager = DatabaseManager()
+    if not await db_manager.initialize():
+        print("❌ Impossible de se connecter à MongoDB")
+        sys.exit(1)
+    collection = db_manager.get_client()[db_manager.database_name][PRODUCT_COLLECTION]
+
+    query = {"price_cents": {"$exists": False}} if only_missing else {}
+    start = time.perf_counter()
+    scanned, modified, operations = 0, 0, []
+    async for doc in collection.find(query, RAW_FIELDS).batch_size(batch_size):
+        scanned += 1
+        raw = {key: doc[key] for key in RAW_FIELDS if key in doc}
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": normalize_product(raw)}))
+        if len(operations) >= batch_size:
+            if not dry_run:
+                result = await collection.bulk_write(operations, ordered=False)
+                modified += result.modified_count
+            operations = []
+    if operations and not dry_run:
+        result = await collection.bulk_write(operations, ordered=False)
+        modified += result.modified_count
+    if modified:
+        # Invalide les caches de requêtes et de facettes (partagés via Redis)
+        await bump_catalog_version()
+
+    print(
+        f"✅ {scanned} produits parcourus, {modified} mis à jour "
+        f"en {time.perf_counter() - start:.1f}s{' (simulation)' if dry_run else ''}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rétro-calcul des champs normalisés")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--only-missing", action="store_true", help="Ignore les produits déjà normalisés"
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.only_missing, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
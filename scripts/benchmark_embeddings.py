@@ -0,0 +1,85 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import api  # Charge .env et remplace sqlite3 par pysqlite3
+import argparse
+import asyncio
+import statistics
+import time
+from api.bd_scraping_arbook.database import DatabaseManager
+from api.bd_scraping_arbook.indexes import PRODUCT_COLLECTION
+from chatbot.chromadb import format_product_text
+from chatbot.embeddings import get_base_embeddings
+
+# Compare les backends d'embeddings (distant / local CPU) sans cache :
+# débit de construction de l'index et latence des requêtes.
+# Exemple : python scripts/benchmark_embeddings.py --backends openai local --limit 1000
+
+QUERIES = [
+    "chaussures de running homme",
+    "robe d'été en coton",
+    "casque audio sans fil",
+    "sac à main en cuir seconde main",
+    "jouet pour enfant de 3 ans",
+]
+
+
+async def load_texts(limit):
+    db_manager = DatabaseManager()
+    if not await db_manager.initialize():
+        print("❌ Impossible de se connecter à MongoDB")
+        sys.exit(1)
+    collection = db_manager.get_client()[db_manager.database_name][PRODUCT_COLLECTION]
+    docs = await collection.find().limit(limit).to_list(length=limit)
+    return [format_product_text(doc) for doc in docs]
+
+
+def benchmark(backend, texts, batch_size, repeat):
+    start = time.perf_counter()
+    embeddings = get_base_embeddings(backend)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        embeddings.embed_documents(texts[i : i + batch_size])
+    build_time = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            embeddings.embed_query(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "load_s": load_time,
+        "docs_per_s": len(texts) / build_time if build_time else float("nan"),
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des backends d'embeddings")
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"])
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=4)
+    args = parser.parse_args()
+
+    texts = asyncio.run(load_texts(args.limit))
+    print(f"{len(texts)} produits chargés depuis MongoDB")
+    print(f"{'backend':>8} {'chargement (s)':>15} {'docs/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for backend in args.backends:
+        result = benchmark(backend, texts, args.batch_size, args.repeat)
+        print(
+            f"{backend:>8} {result['load_s']:>15.2f} {result['docs_per_s']:>8.1f} "
+            f"{result['query_p50_ms']:>9.1f} {result['query_p95_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import statistics
+import time
+import cv2
+from models.arcface_model import ArcFaceModel, DET_SIZES
+
+# Benchmark de latence par étape du pipeline visage (détection / alignement + embedding) sur CPU.
+# Exemple : python scripts/benchmark_face_pipeline.py photo.jpg --det-sizes 320 640 --max-sides 0 1280
+
+
+def run(model, img, request_type, det_max_side, repeat):
+    stages = {"downscale": [], "detect": [], "embed": [], "total": []}
+    n_faces = 0
+    for _ in range(repeat):
+        timings = {}
+        start = time.perf_counter()
+        faces = model.detect(img, request_type, det_max_side=det_max_side, timings=timings)
+        model.extract(img, faces, timings=timings)
+        timings["total"] = time.perf_counter() - start
+        n_faces = len(faces)
+        for stage, values in stages.items():
+            values.append(timings.get(stage, 0.0) * 1000)
+    return stages, n_faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline ArcFace")
+    parser.add_argument("image", help="Image de test")
+    parser.add_argument("--det-sizes", type=int, nargs="+", default=[320, 480, 640])
+    parser.add_argument("--max-sides", type=int, nargs="+", default=[0, 1280, 960])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image)
+    if img is None:
+        print(f"❌ Erreur : Impossible de charger l'image {args.image}")
+        sys.exit(1)
+
+    model = ArcFaceModel(ctx_id=-1)
+    print(f"Image : {img.shape[1]}x{img.shape[0]}")
+    print(
+        f"{'det_size':>8} {'max_side':>8} {'faces':>5} "
+        f"{'downscale':>10} {'detect':>10} {'embed':>10} {'total':>10}  (ms, médiane)"
+    )
+    for det_size in args.det_sizes:
+        DET_SIZES["benchmark"] = (det_size, det_size)
+        for max_side in args.max_sides:
+            run(model, img, "benchmark", max_side, args.warmup)
+            stages, n_faces = run(model, img, "benchmark", max_side, args.repeat)
+            medians = {k: statistics.median(v) for k, v in stages.items()}
+            print(
+                f"{det_size:>8} {max_side:>8} {n_faces:>5} "
+                f"{medians['downscale']:>10.2f} {medians['detect']:>10.2f} "
+                f"{medians['embed']:>10.2f} {medians['total']:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
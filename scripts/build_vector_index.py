@@ -0,0 +1,166 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import api  # Charge .env et remplace sqlite3 par pysqlite3
+import argparse
+import asyncio
+import json
+import shutil
+import time
+from datetime import datetime, timezone
+from api.bd_scraping_arbook.database import DatabaseManager
+from api.bd_scraping_arbook.indexes import PRODUCT_COLLECTION
+from chatbot.chromadb import (
+    CHROMA_SNAPSHOT_ROOT,
+    MANIFEST_FILE,
+    PUBLISHED_FILE,
+    ChromaManager,
+    current_snapshot,
+    publish_snapshot,
+    published_at,
+    read_manifest,
+)
+from chatbot.embeddings import embedding_model_name
+
+# Construit hors ligne une version de l'index vectoriel dans un répertoire
+# `<root>/<version>/`, puis publie cette version via le pointeur `<root>/CURRENT`.
+# Les workers de l'API (CHROMA_INDEX_MODE=snapshot) la chargent en lecture seule.
+# Par défaut, la version courante est copiée puis réconciliée : seuls les
+# produits modifiés sont ré-encodés.
+# Exemple : python scripts/build_vector_index.py --keep 3
+
+# Les workers ne relisent CURRENT que toutes les CHATBOT_REFRESH_INTERVAL
+# secondes : une version remplacée depuis moins longtemps peut encore être ouverte
+SNAPSHOT_GRACE_SECONDS = 2 * float(os.environ.get("CHATBOT_REFRESH_INTERVAL", "300"))
+
+
+def prune_snapshots(root, keep, grace=SNAPSHOT_GRACE_SECONDS):
+    """Supprime les versions antérieures à CURRENT au-delà de `keep` (CURRENT compris).
+
+    Ne sont jamais supprimées : la version publiée juste avant CURRENT, et
+    toute version qui n'est plus courante que depuis moins de `grace` secondes.
+    Les versions plus récentes que CURRENT (--no-publish) sont conservées.
+    """
+    current = current_snapshot(root)
+    if current is None:
+        return
+    versions = sorted(
+        entry.name
+        for entry in os.scandir(root)
+        if entry.is_dir() and entry.name < current
+    )
+    published = {
+        entry.name: published_at(os.path.join(root, entry.name))
+        for entry in os.scandir(root)
+        if entry.is_dir()
+    }
+    publications = sorted((t, version) for version, t in published.items() if t is not None)
+    # Date à laquelle chaque version publiée a cessé d'être courante
+    superseded_at = {
+        version: next_published
+        for (_, version), (next_published, _) in zip(publications, publications[1:])
+    }
+    # La version publiée juste avant CURRENT, et la plus récente par le nom
+    previous = [version for _, version in publications if version != current]
+    protected = {previous[-1]} if previous else set()
+    if versions:
+        protected.add(versions[-1])
+
+    excess = len(versions) + 1 - keep
+    now = time.time()
+    for version in versions:
+        if excess <= 0:
+            break
+        if version in protected:
+            continue
+        superseded = superseded_at.get(version)
+        if published.get(version) is not None and (superseded is None or now - superseded < grace):
+            continue  # Peut-être encore ouverte par un worker en retard
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+        excess -= 1
+        print(f"🗑️  Snapshot {version} supprimé")
+
+
+async def build(root, full, publish):
+    db_manager = DatabaseManager()
+    if not await db_manager.initialize():
+        print("❌ Impossible de se connecter à MongoDB")
+        sys.exit(1)
+    collection = db_manager.get_client()[db_manager.database_name][PRODUCT_COLLECTION]
+
+    os.makedirs(root, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    snapshot_dir = os.path.join(root, version)
+    base_version = None if full else current_snapshot(root)
+    if base_version:
+        base_manifest = read_manifest(os.path.join(root, base_version))
+        if base_manifest and base_manifest.get("embedding_model") == embedding_model_name():
+            shutil.copytree(os.path.join(root, base_version), snapshot_dir)
+            os.remove(os.path.join(snapshot_dir, MANIFEST_FILE))
+            if os.path.exists(os.path.join(snapshot_dir, PUBLISHED_FILE)):
+                os.remove(os.path.join(snapshot_dir, PUBLISHED_FILE))
+        else:
+            base_version = None
+
+    start = time.perf_counter()
+    manager = ChromaManager(collection, persist_directory=snapshot_dir, read_only=False)
+    if base_version:
+        upserted, deleted = await manager.reconcile()
+    else:
+        upserted, deleted = await manager.sync(), 0
+    documents = manager._vector_store._collection.count()
+
+    # Le manifeste est écrit en dernier : un répertoire sans manifeste est incomplet
+    manifest = {
+        "version": version,
+        "base_version": base_version,
+        "collection_name": manager.collection_name,
+        "embedding_model": embedding_model_name(),
+        "documents": documents,
+        "upserted": upserted,
+        "deleted": deleted,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+    print(
+        f"✅ Snapshot {version} : {documents} documents, {upserted} ré-encodés, "
+        f"{deleted} supprimés en {time.perf_counter() - start:.1f}s"
+    )
+
+    if publish:
+        publish_snapshot(root, version)
+        print(f"📌 CURRENT -> {version}")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construction hors ligne de l'index vectoriel")
+    parser.add_argument("--root", default=CHROMA_SNAPSHOT_ROOT)
+    parser.add_argument(
+        "--full", action="store_true", help="Reconstruit sans partir de la version courante"
+    )
+    parser.add_argument(
+        "--no-publish", action="store_true", help="Construit sans basculer CURRENT"
+    )
+    parser.add_argument(
+        "--keep", type=int, default=3, help="Nombre de versions conservées (CURRENT inclus)"
+    )
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=SNAPSHOT_GRACE_SECONDS,
+        help="Secondes pendant lesquelles une version remplacée reste protégée",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(build(args.root, args.full, not args.no_publish))
+    if args.keep > 0:
+        prune_snapshots(args.root, args.keep, args.grace)
+
+
+if __name__ == "__main__":
+    main()
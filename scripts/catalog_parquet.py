@@ -0,0 +1,350 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import api  # Charge .env et remplace sqlite3 par pysqlite3
+import argparse
+import asyncio
+import shutil
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from bson import ObjectId, json_util
+from pymongo import ReplaceOne
+from api.bd_scraping_arbook.cache import bump_catalog_version
+from api.bd_scraping_arbook.database import DatabaseManager
+from api.bd_scraping_arbook.indexes import PRODUCT_COLLECTION
+
+# Export / import de Product_scraping au format Parquet, partitionné par
+# source et date de scraping (updated_at) : <dossier>/source=vinted/scrape_date=2025-03-01/
+# Les champs de forme variable (colors, sizes, feature_table, price_history...)
+# sont stockés en JSON étendu pour garder un schéma stable.
+# Exemples :
+#   python scripts/catalog_parquet.py export ./exports/catalog --source vinted
+#   python scripts/catalog_parquet.py import ./exports/catalog --dry-run
+
+STRING_FIELDS = [
+    "source",
+    "product_id",
+    "name",
+    "price",
+    "url",
+    "main_photo",
+    "description",
+    "price_with_protection",
+    "condition",
+    "delivery_price",
+    "rating",
+    "brand",
+    "payment_methods",
+    "owner_name",
+    "owner_profile_url",
+    "currency",
+    "condition_normalized",
+    "content_hash",
+]
+LIST_FIELDS = ["categories", "detailed_photos", "feature_bullet"]
+BOOL_FIELDS = ["stock", "is_exclusive"]
+INT_FIELDS = [
+    "views",
+    "interested",
+    "price_cents",
+    "delivery_price_cents",
+    "price_with_protection_cents",
+]
+FLOAT_FIELDS = ["rating_value"]
+DATETIME_FIELDS = ["updated_at", "uploaded_at", "last_seen_at"]
+JSON_FIELDS = [
+    "sizes",
+    "colors",
+    "uploaded",
+    "feature_table",
+    "price_history",
+]
+PARTITION_FIELDS = ["source", "scrape_date"]
+
+
+def load_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("❌ Le paquet `pyarrow` est requis : pip install pyarrow")
+        sys.exit(1)
+    return pa, pq
+
+
+def build_schema(pa):
+    columns = [("_id", pa.string())]
+    columns += [(name, pa.string()) for name in STRING_FIELDS if name != "source"]
+    columns += [(name, pa.list_(pa.string())) for name in LIST_FIELDS]
+    columns += [(name, pa.bool_()) for name in BOOL_FIELDS]
+    columns += [(name, pa.int64()) for name in INT_FIELDS]
+    columns += [(name, pa.float64()) for name in FLOAT_FIELDS]
+    columns += [(name, pa.timestamp("ms", tz="UTC")) for name in DATETIME_FIELDS]
+    columns += [(name, pa.string()) for name in JSON_FIELDS]
+    return pa.schema(columns)
+
+
+def _as_int(value):
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def to_row(doc: dict) -> dict:
+    """Document MongoDB -> ligne typée (la source est portée par la partition)."""
+    row = {"_id": str(doc["_id"])}
+    for name in STRING_FIELDS:
+        if name != "source":
+            value = doc.get(name)
+            row[name] = str(value) if value is not None else None
+    for name in LIST_FIELDS:
+        value = doc.get(name)
+        row[name] = [str(v) for v in value] if isinstance(value, list) else None
+    for name in BOOL_FIELDS:
+        value = doc.get(name)
+        row[name] = value if isinstance(value, bool) else None
+    for name in INT_FIELDS:
+        row[name] = _as_int(doc.get(name))
+    for name in FLOAT_FIELDS:
+        row[name] = _as_float(doc.get(name))
+    for name in DATETIME_FIELDS:
+        value = doc.get(name)
+        row[name] = value if isinstance(value, datetime) else None
+    for name in JSON_FIELDS:
+        value = doc.get(name)
+        row[name] = json_util.dumps(value) if value is not None else None
+    return row
+
+
+def from_row(row: dict, source: str, keep_ids: bool) -> dict:
+    """Ligne Parquet -> document MongoDB (champs nuls omis)."""
+    doc = {"source": source}
+    for name, value in row.items():
+        if value is None or name in PARTITION_FIELDS:
+            continue
+        if name == "_id":
+            if keep_ids:
+                doc["_id"] = ObjectId(value)
+        elif name in JSON_FIELDS:
+            doc[name] = json_util.loads(value)
+        else:
+            doc[name] = value
+    return doc
+
+
+class PartitionWriters:
+    """Un ParquetWriter par partition, les moins récemment utilisés étant fermés
+    au-delà de `max_open` (la partition reprend alors dans un nouveau fichier)."""
+
+    def __init__(self, pq, root, schema, compression, max_open=32):
+        self.pq = pq
+        self.root = root
+        self.schema = schema
+        self.compression = compression
+        self.max_open = max_open
+        self._writers = OrderedDict()
+        self._parts = {}
+        self.files = 0
+
+    def write(self, partition, table):
+        writer = self._writers.get(partition)
+        if writer is None:
+            source, scrape_date = partition
+            directory = os.path.join(
+                self.root, f"source={source}", f"scrape_date={scrape_date}"
+            )
+            os.makedirs(directory, exist_ok=True)
+            part = self._parts.get(partition, 0)
+            self._parts[partition] = part + 1
+            path = os.path.join(directory, f"part-{part:05d}.parquet")
+            writer = self.pq.ParquetWriter(path, self.schema, compression=self.compression)
+            self._writers[partition] = writer
+            self.files += 1
+            while len(self._writers) > self.max_open:
+                self._writers.popitem(last=False)[1].close()
+        self._writers.move_to_end(partition)
+        writer.write_table(table)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def prepare_output(output, overwrite):
+    """Refuse un dossier de destination non vide, ou le vide avec `--overwrite`.
+
+    Des fichiers d'un export précédent resteraient sinon à côté des nouveaux :
+    un produit dont `updated_at` a changé de jour serait présent dans deux
+    partitions, et l'import rejouerait les deux versions dans un ordre quelconque.
+    """
+    entries = os.listdir(output) if os.path.isdir(output) else []
+    if not entries:
+        return
+    if not overwrite:
+        print(f"❌ {output} n'est pas vide (utiliser --overwrite pour le remplacer)")
+        sys.exit(1)
+    foreign = [entry for entry in entries if not entry.startswith("source=")]
+    if foreign:
+        # Ne supprime que ce qui ressemble à un export de ce script
+        print(f"❌ {output} contient des fichiers étrangers à un export : {', '.join(foreign[:5])}")
+        sys.exit(1)
+    for entry in entries:
+        shutil.rmtree(os.path.join(output, entry))
+
+
+async def connect():
+    db_manager = DatabaseManager()
+    if not await db_manager.initialize():
+        print("❌ Impossible de se connecter à MongoDB")
+        sys.exit(1)
+    return db_manager.get_client()[db_manager.database_name][PRODUCT_COLLECTION]
+
+
+async def export_catalog(output, sources, since, batch_size, compression, overwrite):
+    pa, pq = load_pyarrow()
+    schema = build_schema(pa)
+    prepare_output(output, overwrite)
+    collection = await connect()
+
+    query = {}
+    if sources:
+        query["source"] = {"$in": sources}
+    if since:
+        query["updated_at"] = {"$gte": datetime.fromisoformat(since)}
+
+    writers = PartitionWriters(pq, output, schema, compression)
+    start = time.perf_counter()
+    exported, pending = 0, {}
+
+    def flush(partition):
+        rows = pending.pop(partition)
+        writers.write(partition, pa.Table.from_pylist(rows, schema=schema))
+
+    try:
+        async for doc in collection.find(query).batch_size(batch_size):
+            updated_at = doc.get("updated_at")
+            partition = (
+                doc.get("source") or "unknown",
+                updated_at.strftime("%Y-%m-%d") if isinstance(updated_at, datetime) else "unknown",
+            )
+            pending.setdefault(partition, []).append(to_row(doc))
+            exported += 1
+            if len(pending[partition]) >= batch_size:
+                flush(partition)
+        for partition in list(pending):
+            flush(partition)
+    finally:
+        writers.close()
+
+    print(
+        f"✅ {exported} produits exportés dans {writers.files} fichiers "
+        f"en {time.perf_counter() - start:.1f}s -> {output}"
+    )
+
+
+async def import_catalog(input_dir, sources, batch_size, keep_ids, dry_run):
+    load_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(input_dir, format="parquet", partitioning="hive")
+    filter_expr = ds.field("source").isin(sources) if sources else None
+    collection = None if dry_run else await connect()
+
+    start = time.perf_counter()
+    # `updated_at` d'origine souvent antérieur au filigrane de synchronisation
+    # ChromaDB : la date d'import garantit que la synchronisation incrémentale
+    # ré-indexe les produits restaurés (la date d'origine reste dans le Parquet)
+    imported_at = datetime.now(timezone.utc)
+    read, upserted, modified = 0, 0, 0
+    for batch in dataset.to_batches(filter=filter_expr, batch_size=batch_size):
+        operations = []
+        for row in batch.to_pylist():
+            doc = from_row(row, str(row["source"]), keep_ids)
+            if not doc.get("product_id"):
+                continue
+            doc["updated_at"] = imported_at
+            # Même clé que l'index unique : la restauration est idempotente
+            operations.append(
+                ReplaceOne(
+                    {"source": doc["source"], "product_id": doc["product_id"]},
+                    doc,
+                    upsert=True,
+                )
+            )
+        read += batch.num_rows
+        if operations and not dry_run:
+            result = await collection.bulk_write(operations, ordered=False)
+            upserted += result.upserted_count
+            modified += result.modified_count
+    if upserted or modified:
+        # Invalide les caches de requêtes et de facettes (partagés via Redis)
+        await bump_catalog_version()
+
+    print(
+        f"✅ {read} produits lus, {upserted} insérés, {modified} remplacés "
+        f"en {time.perf_counter() - start:.1f}s{' (simulation)' if dry_run else ''}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / import Parquet du catalogue produits")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="MongoDB -> Parquet")
+    export_parser.add_argument("output", help="Dossier de destination")
+    export_parser.add_argument("--source", action="append", help="Répétable (vinted, amazon)")
+    export_parser.add_argument(
+        "--since", help="Produits mis à jour depuis cette date (ISO, ex. 2025-03-01)"
+    )
+    export_parser.add_argument("--batch-size", type=int, default=5000)
+    export_parser.add_argument("--compression", default="zstd")
+    export_parser.add_argument(
+        "--overwrite", action="store_true", help="Remplace un export existant dans le dossier"
+    )
+
+    import_parser = subparsers.add_parser("import", help="Parquet -> MongoDB")
+    import_parser.add_argument("input", help="Dossier produit par `export`")
+    import_parser.add_argument("--source", action="append", help="Répétable (vinted, amazon)")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    import_parser.add_argument(
+        "--keep-ids",
+        action="store_true",
+        help="Conserve les _id d'origine (restauration dans une collection vide)",
+    )
+    import_parser.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        asyncio.run(
+            export_catalog(
+                args.output,
+                args.source,
+                args.since,
+                args.batch_size,
+                args.compression,
+                args.overwrite,
+            )
+        )
+    else:
+        asyncio.run(
+            import_catalog(
+                args.input, args.source, args.batch_size, args.keep_ids, args.dry_run
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
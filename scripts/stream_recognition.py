@@ -0,0 +1,32 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import time
+from database.db import SessionLocal
+from database.user_model import FaceEmbedding
+from services_reconnaissance.face_recognition import model, build_gallery
+from utils.capture_utils import camera
+from utils.face_processing import FaceStreamPipeline
+
+# Reconnaissance faciale en continu depuis la caméra, déclenchée par le mouvement.
+
+with SessionLocal() as db:
+    gallery = build_gallery(
+        db.query(FaceEmbedding.name, FaceEmbedding.embedding).all()
+    )
+print(f"Galerie chargée : {len(gallery[0])} visages")
+
+pipeline = FaceStreamPipeline(camera, model, gallery, on_result=print)
+pipeline.start()
+try:
+    while camera.running:
+        time.sleep(5)
+        print(f"Stats : {pipeline.stats} (images jetées à la capture : {camera.dropped})")
+except KeyboardInterrupt:
+    pass
+finally:
+    pipeline.stop()
+    camera.stop()
@@ -0,0 +1,129 @@
+import sys
+import os
+
+# Ajouter le chemin de la racine du projet au PATH
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import statistics
+import threading
+import time
+import cv2
+import torch
+from torchvision import models
+from models.arcface_model import ArcFaceModel
+from models.runtime_config import (
+    OrtRuntimeConfig,
+    TorchRuntimeConfig,
+    apply_ort_config,
+    apply_torch_config,
+)
+
+# Cherche la meilleure répartition des cœurs entre ONNX Runtime (insightface)
+# et PyTorch (EfficientNet) sous charge concurrente.
+# Exemple : python scripts/tune_threads.py photo.jpg --duration 15
+
+
+def worker(fn, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def measure(face_fn, torch_fn, duration, face_clients, torch_clients):
+    stop = threading.Event()
+    face_latencies, torch_latencies = [], []
+    threads = [
+        threading.Thread(target=worker, args=(face_fn, stop, face_latencies))
+        for _ in range(face_clients)
+    ] + [
+        threading.Thread(target=worker, args=(torch_fn, stop, torch_latencies))
+        for _ in range(torch_clients)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return face_latencies, torch_latencies
+
+
+def p95(values):
+    if len(values) < 2:
+        return values[0] if values else float("nan")
+    return statistics.quantiles(values, n=20)[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réglage des pools de threads ORT/PyTorch")
+    parser.add_argument("image", help="Image contenant au moins un visage")
+    parser.add_argument("--cores", type=int, default=os.cpu_count())
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--face-clients", type=int, default=2)
+    parser.add_argument("--torch-clients", type=int, default=1)
+    parser.add_argument("--execution-mode", default="sequential")
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image)
+    if img is None:
+        print(f"❌ Erreur : Impossible de charger l'image {args.image}")
+        sys.exit(1)
+
+    face_model = ArcFaceModel(ctx_id=-1)
+    # Les poids n'influencent pas la latence : architecture seule
+    effnet = models.efficientnet_b3(weights=None)
+    effnet.classifier = torch.nn.Sequential(
+        torch.nn.Linear(effnet.classifier[1].in_features, 1)
+    )
+    effnet.eval()
+    tensor = torch.rand(1, 3, 256, 256)
+
+    def face_fn():
+        face_model.get_faces(img, "recognize")
+
+    def torch_fn():
+        with torch.no_grad():
+            effnet(tensor)
+
+    print(f"Cœurs disponibles : {args.cores}")
+    print(
+        f"{'ort':>4} {'torch':>5} {'face/s':>8} {'face p95':>9} "
+        f"{'torch/s':>8} {'torch p95':>10}"
+    )
+    best = None
+    for ort_threads in range(1, args.cores):
+        torch_threads = args.cores - ort_threads
+        apply_ort_config(
+            face_model.app,
+            OrtRuntimeConfig(
+                intra_op_threads=ort_threads,
+                inter_op_threads=1,
+                execution_mode=args.execution_mode,
+            ),
+        )
+        apply_torch_config(TorchRuntimeConfig(num_threads=torch_threads))
+        face_lat, torch_lat = measure(
+            face_fn, torch_fn, args.duration, args.face_clients, args.torch_clients
+        )
+        face_rate = len(face_lat) / args.duration
+        torch_rate = len(torch_lat) / args.duration
+        print(
+            f"{ort_threads:>4} {torch_threads:>5} {face_rate:>8.1f} {p95(face_lat):>9.1f} "
+            f"{torch_rate:>8.1f} {p95(torch_lat):>10.1f}"
+        )
+        # Critère : pire p95 des deux modèles
+        score = max(p95(face_lat), p95(torch_lat))
+        if best is None or score < best[0]:
+            best = (score, ort_threads, torch_threads)
+
+    if best:
+        print(
+            f"\nMeilleure répartition : ORT_INTRA_OP_THREADS={best[1]} "
+            f"TORCH_NUM_THREADS={best[2]} (p95 max {best[0]:.1f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
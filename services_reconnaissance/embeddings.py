@@ -11,3 +11,24 @@ def compare_embeddings(embedding1, embedding2, threshold=1.0):
     """Compare deux embeddings avec un seuil"""
     distance = np.linalg.norm(embedding1 - embedding2)
     return distance < threshold
+
+
+def match_embeddings(queries, gallery, threshold=1.0):
+    """Associe chaque requête à son plus proche voisin de la galerie.
+
+    Les embeddings étant normalisés, ||q - g||² = 2 - 2 q·g : toutes les
+    distances sont obtenues avec un seul produit matriciel.
+    Retourne (indices, distances) ; l'indice vaut -1 au-delà du seuil.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    if gallery is None or len(gallery) == 0:
+        return (
+            np.full(len(queries), -1, dtype=np.int64),
+            np.full(len(queries), np.inf, dtype=np.float32),
+        )
+    similarities = queries @ np.asarray(gallery, dtype=np.float32).T
+    best = np.argmax(similarities, axis=1)
+    best_similarity = similarities[np.arange(len(queries)), best]
+    distances = np.sqrt(np.maximum(2.0 - 2.0 * best_similarity, 0.0))
+    indices = np.where(distances < threshold, best, -1)
+    return indices, distances
@@ -1,19 +1,34 @@
 import os
+import asyncio
 import cv2
 import numpy as np
 import pickle
-from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.arcface_model import ArcFaceModel
 from database.user_model import FaceEmbedding
 from .image_processing import decode_base64_image
-from .embeddings import normalize_embedding, compare_embeddings
+from .embeddings import normalize_embedding, compare_embeddings, match_embeddings
 
 model = ArcFaceModel()
 
+# Pool dédié à l'inférence : ONNX Runtime libère le GIL, la boucle d'événements
+# reste disponible pour les autres endpoints (scraping, requêtes, bot).
+FACE_INFERENCE_WORKERS = int(os.environ.get("FACE_INFERENCE_WORKERS", "2"))
+inference_executor = ThreadPoolExecutor(
+    max_workers=FACE_INFERENCE_WORKERS, thread_name_prefix="face-inference"
+)
 
-def capture_face(name: str, image_base64: str, db: Session):
-    """Capture et enregistre un visage dans la base de données"""
 
+async def run_inference(fn, *args):
+    """Exécute une fonction d'inférence dans le pool dédié"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, fn, *args)
+
+
+def _capture_embedding(name: str, image_base64: str):
     frame = decode_base64_image(image_base64)
     if frame is None:
         raise ValueError("L'image est invalide ou vide.")
@@ -23,49 +38,109 @@ def capture_face(name: str, image_base64: str, db: Session):
     img_path = os.path.join(save_dir, f"{name}.jpg")
     cv2.imwrite(img_path, frame)
 
-    embedding = model.get_embedding(img_path)
+    embedding = model.get_embedding(img_path, "capture")
     if embedding is None:
         raise ValueError("Aucun visage détecté.")
 
-    normalized_embedding = normalize_embedding(embedding)
+    return normalize_embedding(embedding)
+
+
+def _recognize_embedding(image_base64: str):
+    frame = decode_base64_image(image_base64)
+    if frame is None:
+        raise ValueError("L'image est invalide ou vide.")
+
+    faces = model.get_faces(frame, "recognize")
+    if len(faces) == 0:
+        return None
+    return faces[0].normed_embedding
+
+
+def _detect_and_embed(images_base64: List[str]):
+    frames = [decode_base64_image(image) for image in images_base64]
+    faces_per_image = [
+        model.detect(frame, "recognize") if frame is not None else []
+        for frame in frames
+    ]
+    model.extract_batch(frames, faces_per_image)
+    return frames, faces_per_image
+
+
+def build_gallery(rows):
+    """Construit (noms, matrice d'embeddings) à partir de lignes (name, embedding)"""
+
+    names = [row.name for row in rows]
+    if not rows:
+        return names, np.empty((0, 0), dtype=np.float32)
+    gallery = np.stack([pickle.loads(row.embedding) for row in rows])
+    return names, gallery.astype(np.float32)
+
 
-    existing_faces = db.query(FaceEmbedding).all()
-    for face in existing_faces:
-        stored_embedding = pickle.loads(face.embedding)
+async def load_gallery(db: AsyncSession):
+    """Charge les visages enregistrés sous forme de (noms, matrice d'embeddings)"""
+
+    result = await db.execute(select(FaceEmbedding.name, FaceEmbedding.embedding))
+    return build_gallery(result.all())
+
+
+async def capture_face(name: str, image_base64: str, db: AsyncSession):
+    """Capture et enregistre un visage dans la base de données"""
+
+    normalized_embedding = await run_inference(_capture_embedding, name, image_base64)
+
+    result = await db.execute(select(FaceEmbedding.embedding))
+    for stored_blob in result.scalars():
+        stored_embedding = pickle.loads(stored_blob)
         if compare_embeddings(normalized_embedding, stored_embedding):
             raise ValueError("Un visage similaire existe déjà.")
 
     embedding_blob = pickle.dumps(normalized_embedding)
     face_entry = FaceEmbedding(name=name, embedding=embedding_blob)
     db.add(face_entry)
-    db.commit()
+    await db.commit()
 
     return f"Visage de {name} enregistré avec succès."
 
 
-def recognize_face(image_base64: str, db: Session):
+async def recognize_face(image_base64: str, db: AsyncSession):
     """Compare un visage avec la base de données et renvoie le meilleur match"""
 
-    frame = decode_base64_image(image_base64)
-    if frame is None:
-        raise ValueError("L'image est invalide ou vide.")
-
-    faces = model.app.get(frame)
-    if len(faces) == 0:
+    query_embedding = await run_inference(_recognize_embedding, image_base64)
+    if query_embedding is None:
         return "Aucun visage détecté."
 
-    query_embedding = faces[0].normed_embedding
-
-    faces_db = db.query(FaceEmbedding).all()
-    best_match = None
-    best_distance = float("inf")
-
-    for face in faces_db:
-        stored_embedding = pickle.loads(face.embedding)
-        distance = np.linalg.norm(query_embedding - stored_embedding)
-
-        if distance < best_distance:
-            best_distance = distance
-            best_match = face.name
-
-    return best_match if best_distance < 1.0 else "Unknown"
+    names, gallery = await load_gallery(db)
+    indices, _ = match_embeddings(query_embedding, gallery)
+    return names[indices[0]] if indices[0] >= 0 else "Unknown"
+
+
+async def recognize_faces(images_base64: List[str], db: AsyncSession):
+    """Reconnaît tous les visages de plusieurs images en un seul passage"""
+
+    frames, faces_per_image = await run_inference(_detect_and_embed, images_base64)
+
+    names, gallery = await load_gallery(db)
+    embeddings = [face.normed_embedding for faces in faces_per_image for face in faces]
+    if embeddings:
+        indices, distances = match_embeddings(np.stack(embeddings), gallery)
+
+    results = []
+    position = 0
+    for i, (frame, faces) in enumerate(zip(frames, faces_per_image)):
+        if frame is None:
+            results.append({"index": i, "error": "L'image est invalide ou vide."})
+            continue
+        matches = []
+        for face in faces:
+            index = indices[position]
+            matches.append(
+                {
+                    "bbox": [round(float(v), 1) for v in face.bbox],
+                    "match": names[index] if index >= 0 else "Unknown",
+                    "distance": float(distances[position]),
+                }
+            )
+            position += 1
+        results.append({"index": i, "faces": matches})
+
+    return results
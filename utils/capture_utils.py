@@ -1,25 +1,75 @@
 import cv2
 import os
+import queue
 import threading
+import time
+
+# Cadence max de lecture de la caméra (0 = pas de limite)
+CAPTURE_FPS = float(os.environ.get("CAPTURE_FPS", "15"))
+
+
+def put_latest(frame_queue: queue.Queue, item) -> bool:
+    """Dépose un élément dans une file bornée en jetant le plus ancien si elle est pleine.
+
+    Retourne True si une image a été abandonnée.
+    """
+    dropped = False
+    while True:
+        try:
+            frame_queue.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                frame_queue.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
 
 
 class CameraCapture:
-    def __init__(self):
-        self.cap = cv2.VideoCapture(0)
+    def __init__(self, source=0, fps=CAPTURE_FPS):
+        self.cap = cv2.VideoCapture(source)
+        self.fps = fps
         self.running = False
         self.frame = None
+        self.frame_id = 0
+        self.dropped = 0
+        self._subscribers = []
 
     def start(self):
         """Démarrer le flux vidéo en arrière-plan."""
         self.running = True
         threading.Thread(target=self._update_frame, daemon=True).start()
 
+    def subscribe(self, maxsize=1) -> queue.Queue:
+        """Retourne une file bornée alimentée avec les (frame_id, image) capturées."""
+        frame_queue = queue.Queue(maxsize=maxsize)
+        self._subscribers.append(frame_queue)
+        return frame_queue
+
     def _update_frame(self):
-        """Capture continue des images pour un affichage fluide."""
+        """Capture continue des images, cadencée à `fps` images par seconde."""
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        next_time = time.monotonic()
         while self.running:
-            ret, self.frame = self.cap.read()
+            ret, frame = self.cap.read()
             if not ret:
                 self.running = False
+                break
+            self.frame = frame
+            self.frame_id += 1
+            for frame_queue in self._subscribers:
+                if put_latest(frame_queue, (self.frame_id, frame)):
+                    self.dropped += 1
+
+            if interval:
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # En retard : on repart de maintenant plutôt que de rattraper
+                    next_time = time.monotonic()
 
     def get_frame(self):
         """Récupérer la dernière image capturée."""
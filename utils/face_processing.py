@@ -0,0 +1,176 @@
+import os
+import queue
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from services_reconnaissance.embeddings import match_embeddings
+from utils.capture_utils import put_latest
+from utils.movement_detection import MovementDetector
+
+logging.basicConfig(level=os.environ.get("LOGLEVEL"))
+
+
+@dataclass
+class Track:
+    track_id: int
+    bbox: np.ndarray
+    name: Optional[str] = None
+    distance: Optional[float] = None
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+def iou(box_a, box_b) -> float:
+    """Intersection sur union de deux boîtes [x1, y1, x2, y2]."""
+    x1, y1 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+    x2, y2 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceStreamPipeline:
+    """Reconnaissance faciale temps réel pilotée par le mouvement.
+
+    caméra -> détection de mouvement (image réduite, niveaux de gris)
+    -> détection des visages uniquement si mouvement
+    -> reconnaissance uniquement pour les nouvelles pistes.
+
+    Chaque étape lit une file bornée qui ne garde que l'image la plus récente :
+    la latence reste bornée quand la scène est chargée et le CPU au repos
+    quand elle est statique.
+    """
+
+    def __init__(
+        self,
+        camera,
+        model,
+        gallery,
+        on_result: Optional[Callable[[Dict], None]] = None,
+        motion_detector: Optional[MovementDetector] = None,
+        iou_threshold: float = 0.3,
+        track_ttl: float = 2.0,
+        match_threshold: float = 1.0,
+    ):
+        self.camera = camera
+        self.model = model
+        self.names, self.gallery = gallery
+        self.on_result = on_result or (lambda result: logging.info(result))
+        self.motion_detector = motion_detector or MovementDetector()
+        self.iou_threshold = iou_threshold
+        self.track_ttl = track_ttl
+        self.match_threshold = match_threshold
+
+        self.frames = camera.subscribe(maxsize=1)
+        self.detections = queue.Queue(maxsize=1)
+        self.tracks: List[Track] = []
+        self._next_track_id = 0
+        self.running = False
+        self._threads = []
+        self.stats = {
+            "frames": 0,
+            "motion_frames": 0,
+            "dropped": 0,
+            "detections": 0,
+            "recognitions": 0,
+        }
+
+    def update_gallery(self, gallery):
+        """Remplace la galerie (noms, matrice) utilisée pour les nouvelles pistes."""
+        self.names, self.gallery = gallery
+
+    def start(self):
+        self.running = True
+        for target in (self._motion_loop, self._detection_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if not self.camera.running:
+            self.camera.start()
+
+    def stop(self):
+        self.running = False
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
+
+    def _motion_loop(self):
+        while self.running:
+            try:
+                frame_id, frame = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.stats["frames"] += 1
+            if not self.motion_detector.detect_motion(frame):
+                continue
+            self.stats["motion_frames"] += 1
+            if put_latest(self.detections, (frame_id, frame)):
+                self.stats["dropped"] += 1
+
+    def _detection_loop(self):
+        while self.running:
+            try:
+                frame_id, frame = self.detections.get(timeout=0.5)
+            except queue.Empty:
+                self._expire_tracks()
+                continue
+            faces = self.model.detect(frame, "stream")
+            self.stats["detections"] += 1
+            new_faces = self._update_tracks(faces)
+            if new_faces:
+                self._recognize(frame_id, frame, new_faces)
+
+    def _expire_tracks(self):
+        now = time.monotonic()
+        self.tracks = [t for t in self.tracks if now - t.last_seen < self.track_ttl]
+
+    def _update_tracks(self, faces):
+        """Associe les détections aux pistes existantes et retourne les visages nouveaux."""
+        self._expire_tracks()
+        now = time.monotonic()
+        new_faces = []
+        unmatched = list(self.tracks)
+        for face in faces:
+            best, best_iou = None, self.iou_threshold
+            for track in unmatched:
+                overlap = iou(face.bbox, track.bbox)
+                if overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is not None:
+                best.bbox = face.bbox
+                best.last_seen = now
+                unmatched.remove(best)
+            else:
+                track = Track(track_id=self._next_track_id, bbox=face.bbox)
+                self._next_track_id += 1
+                self.tracks.append(track)
+                new_faces.append((track, face))
+        return new_faces
+
+    def _recognize(self, frame_id, frame, new_faces):
+        faces = [face for _, face in new_faces]
+        self.model.extract_batch([frame], [faces])
+        indices, distances = match_embeddings(
+            np.stack([face.normed_embedding for face in faces]),
+            self.gallery,
+            self.match_threshold,
+        )
+        self.stats["recognitions"] += len(faces)
+        for (track, face), index, distance in zip(new_faces, indices, distances):
+            track.name = self.names[index] if index >= 0 else "Unknown"
+            track.distance = float(distance)
+            self.on_result(
+                {
+                    "frame_id": frame_id,
+                    "track_id": track.track_id,
+                    "bbox": [round(float(v), 1) for v in face.bbox],
+                    "match": track.name,
+                    "distance": track.distance,
+                }
+            )
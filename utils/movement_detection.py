@@ -3,27 +3,40 @@ import numpy as np
 
 
 class MovementDetector:
-    def __init__(self):
+    def __init__(self, width=160, pixel_threshold=25, min_motion_ratio=0.016):
         self.previous_frame = None
-
-    def detect_motion(self, frame):
-        """Détecte un mouvement entre deux images successives."""
+        self.width = width  # Largeur de l'image réduite utilisée pour la détection
+        self.pixel_threshold = pixel_threshold
+        self.min_motion_ratio = min_motion_ratio  # Part de pixels modifiés
+
+    def _prepare(self, frame):
+        """Réduit l'image et la convertit en niveaux de gris flous."""
+        height, width = frame.shape[:2]
+        if self.width and width > self.width:
+            size = (self.width, max(1, int(height * self.width / width)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
 
-        if self.previous_frame is None:
+    def motion_score(self, frame):
+        """Retourne la proportion de pixels ayant changé depuis l'image précédente."""
+        gray = self._prepare(frame)
+
+        if self.previous_frame is None or self.previous_frame.shape != gray.shape:
             self.previous_frame = gray
-            return False  # Premier appel : pas de mouvement
+            return 0.0  # Premier appel : pas de mouvement
 
         # Calcul de la différence absolue
         delta = cv2.absdiff(self.previous_frame, gray)
         self.previous_frame = gray  # Mise à jour de l'image précédente
 
         # Seuil pour détecter le mouvement
-        threshold = cv2.threshold(delta, 25, 255, cv2.THRESH_BINARY)[1]
+        threshold = cv2.threshold(delta, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1]
         threshold = cv2.dilate(threshold, None, iterations=2)
 
-        # Compter le nombre de pixels qui ont changé
-        motion_score = np.sum(threshold) / 255  # Nombre de pixels blancs
+        # Proportion de pixels qui ont changé
+        return np.count_nonzero(threshold) / threshold.size
 
-        return motion_score > 5000  # Ajuster le seuil selon les besoins
+    def detect_motion(self, frame):
+        """Détecte un mouvement entre deux images successives."""
+        return self.motion_score(frame) > self.min_motion_ratio